@@ -1,10 +1,18 @@
-﻿from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file
+﻿from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, send_file
 from pathlib import Path
+from sqlalchemy import and_, or_
 from lilith.db import Project, Step, Artifact, Event, Checkpoint, init_db, session_scope
 from lilith.planner import deterministic_plan
-from lilith.registry import TOOL_REGISTRY, ToolError
-from lilith.mirror import run_mirror
-from lilith.executor import apply_tool, checkpoint_now, rollback_last
+from lilith.registry import TOOL_REGISTRY, ToolError, ArgsError
+from lilith.mirror import run_mirror, run_plan_mirror, PREVIEW_CACHE
+from lilith.executor import begin_checkpoint, run_step, settle_checkpoint, apply_batch, rollback_last, restore_checkpoint, undo_step, undo_last, BLOBS
+from lilith.scheduler import run_plan
+from lilith.retention import RetentionPolicy, start_sweeper
+from lilith.config import get_settings
+from lilith import fileindex, jobs, bus, procs
+from lilith.eventsink import SINK
+from lilith import eventlog, summary, projectindex
+import hashlib, os, queue
 
 # --- IMPORTANT: point Flask at lilith/templates & lilith/static ---
 BASE = Path(__file__).resolve().parent
@@ -20,12 +28,30 @@ WORKSPACE.mkdir(exist_ok=True)
 CHECKPOINTS.mkdir(exist_ok=True)
 
 init_db(BASE / "lilith" / "lilith.db")
+start_sweeper(CHECKPOINTS, BLOBS, RetentionPolicy.from_settings(get_settings()), get_settings().sweep_interval_s)
+eventlog.start_archiver(get_settings().event_archive_days, get_settings().sweep_interval_s or 600)
 
 @app.route("/")
 def index():
-    with session_scope() as s:
-        projects = s.query(Project).order_by(Project.created_at.desc()).all()
-    return render_template("index.html", projects=projects)
+    q = request.args.get("q", "").strip()
+    if q:
+        return render_template("index.html", q=q, results=projectindex.search(q, 50))
+    projects, next_cursor = projectindex.page()
+    return render_template("index.html", q="", projects=projects, next_cursor=next_cursor,
+                           summaries=summary.many([p.id for p in projects]))
+
+@app.get("/projects/list")
+def project_list():
+    # HTMX: "Load older" rows of the project list, or live search results while typing
+    q = request.args.get("q", "").strip()
+    if q:
+        return render_template("project_results.html", results=projectindex.search(q, 50))
+    try:
+        projects, next_cursor = projectindex.page(request.args.get("before"))
+    except ValueError:
+        return "Bad cursor", 400
+    return render_template("project_rows.html", projects=projects, next_cursor=next_cursor,
+                           summaries=summary.many([p.id for p in projects]))
 
 @app.post("/projects")
 def create_project():
@@ -47,13 +73,70 @@ def create_project():
 
 @app.get("/project/<int:project_id>")
 def project_view(project_id):
+    # sections (steps, artifacts, events, checkpoints) load as fragments; the page itself reads two rows
     with session_scope() as s:
-        p = s.query(Project).get(project_id)
-        steps = s.query(Step).filter(Step.project_id==project_id).order_by(Step.order_idx.asc()).all()
-        artifacts = s.query(Artifact).filter(Artifact.project_id==project_id).order_by(Artifact.created_at.desc()).all()
-        events = s.query(Event).filter(Event.project_id==project_id).order_by(Event.ts.desc()).limit(50).all()
-        cps = s.query(Checkpoint).filter(Checkpoint.project_id==project_id).order_by(Checkpoint.ts.desc()).all()
-    return render_template("project.html", p=p, steps=steps, artifacts=artifacts, events=events, checkpoints=cps)
+        p = s.get(Project, project_id)
+    if p is None:
+        return "Not found", 404
+    return render_template("project.html", p=p, summary=summary.get(project_id), jobs=jobs.recent(project_id))
+
+PAGE = 50
+
+def _fragment(project_id: int, section: str, render):
+    """Serve a project page fragment with an ETag from its summary revision, so an unchanged
+    section costs one primary-key read and a 304 instead of a query and a render."""
+    rev = summary.get(project_id)[f"{section}_rev"]
+    etag = f"{section}-{project_id}-{rev}-{hashlib.sha1(request.query_string).hexdigest()[:8]}"
+    if request.if_none_match.contains(etag):
+        resp = app.make_response(("", 304))
+    else:
+        resp = app.make_response(render())
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"  # always revalidate; the ETag makes that cheap
+    return resp
+
+def _int_arg(name):
+    value = request.args.get(name)
+    return int(value) if value else None
+
+@app.get("/project/<int:project_id>/events")
+def project_events(project_id):
+    # newest page, or "Load older": <li> rows ending with the next page's button
+    before = request.args.get("before")
+    try:
+        eventlog.parse_cursor(before)
+    except ValueError:
+        return "Bad cursor", 400
+    def render():
+        events, next_cursor = eventlog.page(project_id, before, request.args.get("limit", PAGE, type=int))
+        return render_template("events_page.html", project_id=project_id, events=events, next_cursor=next_cursor)
+    return _fragment(project_id, "events", render)
+
+@app.get("/project/<int:project_id>/artifacts")
+def project_artifacts(project_id):
+    before = _int_arg("before")
+    def render():
+        with session_scope() as s:
+            q = s.query(Artifact).filter(Artifact.project_id==project_id)
+            if before:
+                q = q.filter(Artifact.id < before)
+            rows = q.order_by(Artifact.id.desc()).limit(PAGE + 1).all()
+        return render_template("artifacts.html", project_id=project_id, artifacts=rows[:PAGE],
+                               next_cursor=rows[PAGE - 1].id if len(rows) > PAGE else None, first=before is None)
+    return _fragment(project_id, "artifacts", render)
+
+@app.get("/project/<int:project_id>/checkpoints")
+def project_checkpoints(project_id):
+    before = _int_arg("before")
+    def render():
+        with session_scope() as s:
+            q = s.query(Checkpoint).filter(Checkpoint.project_id==project_id)
+            if before:
+                q = q.filter(Checkpoint.id < before)
+            rows = q.order_by(Checkpoint.id.desc()).limit(PAGE + 1).all()
+        return render_template("checkpoints.html", project_id=project_id, checkpoints=rows[:PAGE],
+                               next_cursor=rows[PAGE - 1].id if len(rows) > PAGE else None, first=before is None)
+    return _fragment(project_id, "checkpoints", render)
 
 @app.post("/step/<int:step_id>/mirror")
 def step_mirror(step_id):
@@ -69,48 +152,230 @@ def step_mirror(step_id):
         status = 400
     return render_template("mirror.html", step=st, preview=preview), status
 
+@app.post("/project/<int:project_id>/mirror")
+def project_mirror(project_id):
+    with session_scope() as s:
+        steps = s.query(Step).filter(Step.project_id==project_id, Step.status.notin_(("done", "applied"))) \
+                 .order_by(Step.order_idx.asc()).all()
+    preview = run_plan_mirror(steps, WORKSPACE / str(project_id))
+    return render_template("plan_mirror.html", preview=preview)
+
+@app.get("/api/mirror/cache")
+def mirror_cache_stats():
+    return jsonify(PREVIEW_CACHE.stats())
+
+def _job_response(job_id):
+    # HTMX callers get a self-polling status row, API callers the job id
+    if request.headers.get("HX-Request"):
+        return render_template("job.html", job=jobs.get(job_id)), 202
+    return jsonify({"ok": True, "job_id": job_id, "status_url": url_for("job_status", job_id=job_id)}), 202
+
+@jobs.handler("apply_step")
+def _job_apply_step(args, job_id):
+    step_id = args["step_id"]
+    with session_scope() as s:
+        st = s.query(Step).get(step_id)
+    ws = WORKSPACE / str(st.project_id)
+    # checkpoint: frozen now, made durable in the background
+    cp = begin_checkpoint(project_id=st.project_id, workspace=ws)
+    try:
+        return run_step(step_id, ws)
+    finally:
+        cp.add_done_callback(lambda f: settle_checkpoint(st.project_id, [step_id], f))
+
 @app.post("/step/<int:step_id>/apply")
 def step_apply(step_id):
     with session_scope() as s:
         st = s.query(Step).get(step_id)
-        p = s.query(Project).get(st.project_id)
-    ws = WORKSPACE / str(p.id)
-    # checkpoint
-    cp_path = checkpoint_now(project_id=p.id, workspace=ws)
-    with session_scope() as s:
-        s.add(Event(project_id=p.id, step_id=step_id, kind="checkpoint", payload_json={"zip": str(cp_path)}))
-    # apply
-    try:
-        result = apply_tool(st, ws)
-        with session_scope() as s:
-            st = s.query(Step).get(step_id)
-            st.status = "done"
-            s.add(Event(project_id=st.project_id, step_id=st.id, kind="applied", payload_json=result))
-            # artifacts
-            for a in result.get("artifacts", []):
-                s.add(Artifact(project_id=st.project_id, step_id=st.id, type=a.get("type","file"),
-                               uri=a.get("path"), hash=a.get("hash","")))
-        return jsonify({"ok": True, "message": "Applied", "step_id": step_id})
-    except ToolError as e:
+    return _job_response(jobs.enqueue("apply_step", {"step_id": step_id}, project_id=st.project_id))
+
+@jobs.handler("apply_batch")
+def _job_apply_batch(args, job_id):
+    return apply_batch(args["project_id"], args["step_ids"], WORKSPACE / str(args["project_id"]))
+
+@app.post("/project/<int:project_id>/batch")
+def project_batch(project_id):
+    # JSON {"step_ids": [...]} or repeated form field; defaults to every pending step in plan order
+    step_ids = (request.get_json(silent=True) or {}).get("step_ids") or request.form.getlist("step_ids", type=int)
+    if not step_ids:
         with session_scope() as s:
-            st = s.query(Step).get(step_id)
-            st.status = "error"
-            s.add(Event(project_id=st.project_id, step_id=st.id, kind="error", payload_json={"error": str(e)}))
-        return jsonify({"ok": False, "error": str(e)}), 400
+            step_ids = [sid for (sid,) in s.query(Step.id).filter(Step.project_id==project_id, Step.status.notin_(("done", "applied")))
+                        .order_by(Step.order_idx.asc())]
+    args = {"project_id": project_id, "step_ids": [int(x) for x in step_ids]}
+    return _job_response(jobs.enqueue("apply_batch", args, project_id=project_id))
 
-@app.post("/project/<int:project_id>/rollback")
-def project_rollback(project_id):
-    with session_scope() as s:
-        p = s.query(Project).get(project_id)
-    ws = WORKSPACE / str(p.id)
-    restored = rollback_last(project_id=p.id, workspace=ws)
+@jobs.handler("apply_plan")
+def _job_apply_plan(args, job_id):
+    pid = args["project_id"]
+    return run_plan(pid, WORKSPACE / str(pid), on_progress=lambda **info: jobs.progress(job_id, **info))
+
+@app.post("/project/<int:project_id>/apply")
+def project_apply(project_id):
+    return _job_response(jobs.enqueue("apply_plan", {"project_id": project_id}, project_id=project_id))
+
+@jobs.handler("rollback")
+def _job_rollback(args, job_id):
+    pid = args["project_id"]
+    ws = WORKSPACE / str(pid)
+    if args.get("mode") == "journal":
+        # undo only the files the most recent step touched
+        undone = undo_last(project_id=pid, workspace=ws)
+        if undone:
+            _record_undo(pid, undone)
+        return undone
+    restored = rollback_last(project_id=pid, workspace=ws)
+    SINK.emit(pid, "rolled_back", {"restored": restored})
     with session_scope() as s:
-        s.add(Event(project_id=p.id, kind="rolled_back", payload_json={"restored": restored}))
-        st_any = s.query(Step).filter(Step.project_id==p.id, Step.status=="error").all()
+        st_any = s.query(Step).filter(Step.project_id==pid, Step.status=="error").all()
         for st in st_any:
             st.status = "pending"
+    return {"restored": restored}
+
+@app.post("/project/<int:project_id>/rollback")
+def project_rollback(project_id):
+    jobs.enqueue("rollback", {"project_id": project_id, "mode": request.form.get("mode")}, project_id=project_id)
     return redirect(url_for("project_view", project_id=project_id))
 
+@app.post("/step/<int:step_id>/cancel")
+def step_cancel(step_id):
+    # kills the step's running process (run_command, pip_install); the step then fails as cancelled
+    return jsonify({"ok": procs.cancel(step_id), "step_id": step_id})
+
+@app.get("/job/<int:job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "job not found"}), 404
+    if not request.headers.get("HX-Request"):
+        return jsonify(jobs.as_dict(job))
+    resp = app.make_response(render_template("job.html", job=job))
+    if job.status in ("done", "error"):
+        resp.headers["HX-Trigger"] = "lilith:refresh"  # re-fetch the steps table and tree
+    return resp
+
+@app.get("/project/<int:project_id>/steps")
+def project_steps(project_id):
+    # first page: the whole table; ?after=<order_idx>.<id>: just the next rows
+    after = request.args.get("after")
+    try:
+        after = tuple(int(x) for x in after.split(".")) if after else None
+    except ValueError:
+        return "Bad cursor", 400
+    def render():
+        with session_scope() as s:
+            q = s.query(Step).filter(Step.project_id==project_id)
+            if after:
+                q = q.filter(or_(Step.order_idx > after[0], and_(Step.order_idx == after[0], Step.id > after[1])))
+            rows = q.order_by(Step.order_idx.asc(), Step.id.asc()).limit(PAGE + 1).all()
+        last = rows[PAGE - 1] if len(rows) > PAGE else None
+        return render_template("steps.html" if after is None else "step_rows.html", project_id=project_id,
+                               steps=rows[:PAGE], next_cursor=f"{last.order_idx}.{last.id}" if last else None)
+    return _fragment(project_id, "steps", render)
+
+@app.get("/step/<int:step_id>/row")
+def step_row(step_id):
+    with session_scope() as s:
+        st = s.get(Step, step_id)
+    if st is None:
+        return "Not found", 404
+    return render_template("step_row.html", s=st)
+
+@app.get("/project/<int:project_id>/stream")
+def project_stream(project_id):
+    # SSE: step status changes, new events and live tool output for one project
+    last_id = request.headers.get("Last-Event-ID", type=int)
+    sub = bus.subscribe(project_id)  # before the catch-up query, so nothing falls in between
+
+    def gen():
+        seen = last_id or 0
+        try:
+            yield "retry: 3000\n\n"
+            if last_id is not None:
+                with session_scope() as s:
+                    missed = s.query(Event).filter(Event.project_id==project_id, Event.id > last_id) \
+                              .order_by(Event.id.asc()).all()
+                for e in missed:
+                    seen = e.id
+                    yield bus.format_sse("event", bus.event_message(e), e.id)
+            while not sub.dropped:
+                try:
+                    kind, data, event_id = sub.queue.get(timeout=15)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event_id is not None:
+                    if event_id <= seen:
+                        continue
+                    seen = event_id
+                yield bus.format_sse(kind, data, event_id)
+        finally:
+            bus.unsubscribe(project_id, sub)
+
+    return Response(gen(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _record_undo(project_id, undone):
+    with session_scope() as s:
+        s.add(Event(project_id=project_id, step_id=undone["step_id"], kind="undone", payload_json=undone))
+        st = s.query(Step).get(undone["step_id"])
+        st.status = "pending"
+
+@jobs.handler("undo_step")
+def _job_undo_step(args, job_id):
+    step_id = args["step_id"]
+    with session_scope() as s:
+        st = s.query(Step).get(step_id)
+    undone = undo_step(project_id=st.project_id, step_id=step_id, workspace=WORKSPACE / str(st.project_id))
+    _record_undo(st.project_id, undone)
+    return undone
+
+@app.post("/step/<int:step_id>/undo")
+def step_undo(step_id):
+    with session_scope() as s:
+        st = s.query(Step).get(step_id)
+    return _job_response(jobs.enqueue("undo_step", {"step_id": step_id}, project_id=st.project_id))
+
+@app.get("/project/<int:project_id>/tree")
+def project_tree(project_id):
+    # served from the file index; the filesystem is only walked on an explicit rescan
+    return render_template("tree.html", project_id=project_id, files=fileindex.tree(project_id))
+
+@jobs.handler("rescan")
+def _job_rescan(args, job_id):
+    pid = args["project_id"]
+    return fileindex.rescan(pid, WORKSPACE / str(pid))
+
+@app.post("/project/<int:project_id>/tree/rescan")
+def project_tree_rescan(project_id):
+    return _job_response(jobs.enqueue("rescan", {"project_id": project_id}, project_id=project_id))
+
+@jobs.handler("restore")
+def _job_restore(args, job_id):
+    checkpoint_id = args["checkpoint_id"]
+    with session_scope() as s:
+        cp = s.get(Checkpoint, checkpoint_id)
+    if cp is None:
+        raise ToolError(f"Checkpoint {checkpoint_id} not found")
+    restored = restore_checkpoint(checkpoint_id, WORKSPACE / str(cp.project_id))
+    SINK.emit(cp.project_id, "restored", restored)
+    return restored
+
+@app.post("/checkpoint/<int:checkpoint_id>/restore")
+def checkpoint_restore(checkpoint_id):
+    with session_scope() as s:
+        cp = s.get(Checkpoint, checkpoint_id)
+    if cp is None:
+        return "Not found", 404
+    jobs.enqueue("restore", {"checkpoint_id": checkpoint_id}, project_id=cp.project_id)
+    return redirect(url_for("project_view", project_id=cp.project_id))
+
+@app.post("/api/checkpoints/<int:checkpoint_id>/restore")
+def api_checkpoint_restore(checkpoint_id):
+    with session_scope() as s:
+        cp = s.get(Checkpoint, checkpoint_id)
+    if cp is None:
+        return jsonify({"ok": False, "error": f"Checkpoint {checkpoint_id} not found"}), 404
+    return _job_response(jobs.enqueue("restore", {"checkpoint_id": checkpoint_id}, project_id=cp.project_id))
+
 @app.get("/artifact/<int:artifact_id>/download")
 def artifact_download(artifact_id):
     with session_scope() as s:
@@ -121,15 +386,11 @@ def artifact_download(artifact_id):
     if not file_path.exists():
         return "Not found", 404
     return send_file(file_path, as_attachment=True)
-
-if __name__ == "__main__":
-    app.run(debug=True)
 
 # === LILITH: API ENDPOINTS ===
 from flask import jsonify, request
 from lilith.db import session_scope, Project, Step, Event
 from lilith.mirror import run_mirror
-from lilith.executor import apply_tool, checkpoint_now, rollback_last
 
 def _step_or_404(session, step_id: int):
     step = session.query(Step).get(step_id)
@@ -142,44 +403,60 @@ def api_mirror_step(step_id):
     with session_scope() as s:
         step, err = _step_or_404(s, step_id)
         if err: return err
-        try:
-            preview = run_mirror(step)
-            # Log event
-            e = Event(kind="mirror", message=f"Mirrored step {step_id}", project_id=step.project_id, step_id=step.id)
-            s.add(e)
-            return jsonify({"ok": True, "preview": preview})
-        except Exception as ex:
-            e = Event(kind="error", message=f"Mirror failed for step {step_id}: {ex}", project_id=step.project_id, step_id=step.id)
-            s.add(e)
-            return jsonify({"ok": False, "error": str(ex)}), 500
+    try:
+        preview = run_mirror(step, WORKSPACE / str(step.project_id))
+    except ToolError as ex:
+        return jsonify({"ok": False, "error": str(ex), "errors": getattr(ex, "errors", None)}), 400
+    return jsonify({"ok": True, "preview": preview})
 
 @app.post("/api/steps/<int:step_id>/apply")
 def api_apply_step(step_id):
     with session_scope() as s:
         step, err = _step_or_404(s, step_id)
         if err: return err
+    tool = TOOL_REGISTRY.get(step.tool)
+    if tool is not None and hasattr(tool, "validate"):
+        # reject bad arguments up front instead of in a failed job
         try:
-            out = apply_tool(step)
-            checkpoint_now(step.project_id, reason=f"apply step {step_id}")
-            e = Event(kind="apply", message=f"Applied step {step_id}", project_id=step.project_id, step_id=step.id)
-            s.add(e)
-            return jsonify({"ok": True, "result": out})
-        except Exception as ex:
-            e = Event(kind="error", message=f"Apply failed for step {step_id}: {ex}", project_id=step.project_id, step_id=step.id)
-            s.add(e)
-            return jsonify({"ok": False, "error": str(ex)}), 500
+            tool.validate(WORKSPACE / str(step.project_id), step.args_json or {})
+        except ArgsError as ex:
+            return jsonify({"ok": False, "error": str(ex), "errors": ex.errors}), 400
+    return _job_response(jobs.enqueue("apply_step", {"step_id": step_id}, project_id=step.project_id))
+
+@app.get("/api/projects")
+def api_projects():
+    try:
+        projects, next_cursor = projectindex.page(request.args.get("before"), request.args.get("limit", 50, type=int))
+    except ValueError:
+        return jsonify({"ok": False, "error": "bad cursor"}), 400
+    return jsonify({"ok": True, "next": next_cursor, "projects": [
+        {"id": p.id, "title": p.title, "goal": p.goal, "status": p.status,
+         "created_at": p.created_at.isoformat() if p.created_at else None} for p in projects]})
+
+@app.get("/api/projects/search")
+def api_projects_search():
+    results = projectindex.search(request.args.get("q", ""), request.args.get("limit", 20, type=int))
+    return jsonify({"ok": True, "results": [{k: str(v) if k.endswith("_html") else v for k, v in r.items()}
+                                            for r in results]})
+
+@app.get("/api/projects/<int:project_id>/events")
+def api_project_events(project_id):
+    try:
+        events, next_cursor = eventlog.page(project_id, request.args.get("before"), request.args.get("limit", 50, type=int))
+    except ValueError:
+        return jsonify({"ok": False, "error": "bad cursor"}), 400
+    return jsonify({"ok": True, "events": events, "next": next_cursor})
 
 @app.post("/api/projects/<int:project_id>/rollback")
 def api_rollback_project(project_id):
-    with session_scope() as s:
-        try:
-            rollback_last(project_id)
-            e = Event(kind="rollback", message=f"Rollback on project {project_id}", project_id=project_id)
-            s.add(e)
-            return jsonify({"ok": True})
-        except Exception as ex:
-            e = Event(kind="error", message=f"Rollback failed on project {project_id}: {ex}", project_id=project_id)
-            s.add(e)
-            return jsonify({"ok": False, "error": str(ex)}), 500
+    return _job_response(jobs.enqueue("rollback", {"project_id": project_id}, project_id=project_id))
 # === LILITH: API ENDPOINTS (end) ===
-
+
+# Workers start last: jobs requeued after a restart are claimed at once, so every
+# @jobs.handler above must already be registered. Under `python app.py` the debug
+# reloader's watcher process imports this module too; only its serving child runs jobs.
+if not (__name__ == "__main__" and os.environ.get("WERKZEUG_RUN_MAIN") != "true"):
+    jobs.start_workers(get_settings().job_workers)
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -0,0 +1,158 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import math, shutil, struct, tempfile, time, zipfile, zlib
+
+# Formats that are already compressed: deflating them burns CPU for no gain.
+INCOMPRESSIBLE_EXT = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".ico",
+    ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".rar", ".whl", ".jar",
+    ".mp3", ".mp4", ".m4a", ".ogg", ".webm", ".mov", ".pdf",
+}
+SAMPLE_BYTES = 4096
+ENTROPY_LIMIT = 7.5  # bits per byte; random/compressed data sits near 8
+CHUNK = 256 * 1024
+SPOOL_MAX = 1024 * 1024  # compressed output above this spills to a temp file
+
+# zip32 limits; bigger archives go through zipfile, which writes zip64 records
+_MAX_ENTRIES = 0xFFFF
+_MAX_BYTES = 0xFFFFFFFF
+
+def entropy(sample: bytes) -> float:
+    if not sample:
+        return 0.0
+    counts = [0] * 256
+    for b in sample:
+        counts[b] += 1
+    n = len(sample)
+    return -sum(c / n * math.log2(c / n) for c in counts if c)
+
+def should_store(p: Path) -> bool:
+    if p.suffix.lower() in INCOMPRESSIBLE_EXT:
+        return True
+    with open(p, "rb") as f:
+        return entropy(f.read(SAMPLE_BYTES)) > ENTROPY_LIMIT
+
+def _dos_datetime(mtime: float):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01 00:00
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+def _compress(p: Path, level: int):
+    """Deflate one file into a spooled buffer; runs on a worker thread (zlib releases the GIL).
+    Stored entries return no CRC or sizes: the writer takes them from the bytes it copies."""
+    if should_store(p):
+        return zipfile.ZIP_STORED, None, None, None, None
+    comp = zlib.compressobj(level, zlib.DEFLATED, -15)
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+    crc, size = 0, 0
+    with open(p, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(comp.compress(chunk))
+    spool.write(comp.flush())
+    csize = spool.tell()
+    if csize >= size:
+        # deflate did not help: store the original bytes instead
+        spool.close()
+        return zipfile.ZIP_STORED, None, None, None, None
+    spool.seek(0)
+    return zipfile.ZIP_DEFLATED, crc, size, csize, spool
+
+class _ZipWriter:
+    """Minimal streaming zip32 writer. Entries added with crc=None are stored: CRC and size
+    are computed while copying and patched into the local header, so they match the data
+    even if the file changes while the archive is written."""
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.central = []
+
+    def add(self, name: str, st, method: int, crc: int | None, usize: int | None, csize: int | None, src):
+        raw = name.encode("utf-8")
+        dtime, ddate = _dos_datetime(st.st_mtime)
+        offset = self.fh.tell()
+
+        def local_header():
+            return struct.pack("<IHHHHHIIIHH", 0x04034B50, 20, 0x800, method, dtime, ddate,
+                               crc or 0, csize or 0, usize or 0, len(raw), 0)
+
+        self.fh.write(local_header())
+        self.fh.write(raw)
+        if crc is None:
+            crc = usize = 0
+            for chunk in iter(lambda: src.read(CHUNK), b""):
+                crc = zlib.crc32(chunk, crc)
+                usize += len(chunk)
+                self.fh.write(chunk)
+            csize = usize
+            end = self.fh.tell()
+            self.fh.seek(offset)
+            self.fh.write(local_header())
+            self.fh.seek(end)
+        else:
+            shutil.copyfileobj(src, self.fh, CHUNK)
+        self.central.append(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | 20, 20, 0x800,
+                                        method, dtime, ddate, crc, csize, usize, len(raw), 0, 0, 0, 0,
+                                        (st.st_mode & 0xFFFF) << 16, offset) + raw)
+
+    def close(self):
+        start = self.fh.tell()
+        for rec in self.central:
+            self.fh.write(rec)
+        size = self.fh.tell() - start
+        n = len(self.central)
+        self.fh.write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, n, n, size, start, 0))
+
+def write_zip(files: list, dest: Path, level: int = 6, workers: int = 4) -> dict:
+    """Archive `files` ([(arcname, path, stat), ...]) into `dest`.
+
+    Files are deflated concurrently on a bounded thread pool and streamed into
+    the archive in order; incompressible files are stored. Returns bytes in/out
+    and wall time.
+    """
+    t0 = time.perf_counter()
+    total = sum(st.st_size for _, _, st in files)
+    stored = 0
+    if len(files) >= _MAX_ENTRIES or total >= _MAX_BYTES:
+        stored = _write_zip64(files, dest, level)
+    else:
+        with open(dest, "wb") as fh, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            zw = _ZipWriter(fh)
+            window = deque()
+            # keep a bounded number of files in flight so memory stays flat
+            for item in files:
+                window.append((item, pool.submit(_compress, item[1], level)))
+                if len(window) >= workers * 2:
+                    stored += _drain_one(zw, window)
+            while window:
+                stored += _drain_one(zw, window)
+            zw.close()
+    return {"files": len(files), "stored": stored, "bytes_in": total, "bytes_out": dest.stat().st_size,
+            "wall_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+def _drain_one(zw: _ZipWriter, window: deque) -> int:
+    (name, p, st), fut = window.popleft()
+    method, crc, usize, csize, spool = fut.result()
+    if spool is None:
+        with open(p, "rb") as src:
+            zw.add(name, st, method, crc, usize, csize, src)
+        return 1
+    with spool:
+        zw.add(name, st, method, crc, usize, csize, spool)
+    return 0
+
+def _write_zip64(files: list, dest: Path, level: int) -> int:
+    stored = 0
+    with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED, compresslevel=level, allowZip64=True) as zf:
+        for name, p, st in files:
+            if should_store(p):
+                zf.write(p, name, compress_type=zipfile.ZIP_STORED)
+                stored += 1
+            else:
+                zf.write(p, name)
+    return stored
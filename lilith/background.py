@@ -0,0 +1,19 @@
+import logging, threading
+
+log = logging.getLogger(__name__)
+
+def start_periodic(name: str, interval_s: float, fn) -> threading.Event | None:
+    """Run `fn()` every `interval_s` seconds on a daemon thread; set the returned Event to stop."""
+    if interval_s <= 0:
+        return None
+    stop = threading.Event()
+
+    def _loop():
+        while not stop.wait(interval_s):
+            try:
+                fn()
+            except Exception:
+                log.exception("%s failed", name)
+
+    threading.Thread(target=_loop, name=name, daemon=True).start()
+    return stop
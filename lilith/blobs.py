@@ -0,0 +1,83 @@
+from pathlib import Path
+from lilith.utils import file_hash
+import hashlib, os, shutil, tempfile, threading
+
+class BlobStore:
+    """Content-addressed store: each blob lives once at <root>/<sha[:2]>/<sha>.
+
+    Writers that reference existing blobs without putting them should hold `lock`
+    so garbage collection cannot remove a blob between the check and the reference.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.lock = threading.RLock()
+
+    def path_for(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def has(self, digest: str) -> bool:
+        return self.path_for(digest).exists()
+
+    def touch(self, digest: str) -> bool:
+        # refresh mtime on a dedup hit so the GC grace period covers fresh references
+        try:
+            os.utime(self.path_for(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _commit(self, tmp: str, digest: str) -> str:
+        dest = self.path_for(digest)
+        if dest.exists():
+            os.unlink(tmp)
+        else:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, dest)
+        return digest
+
+    def _tmp(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        return tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+
+    def put_file(self, src: Path, digest: str | None = None) -> str:
+        digest = digest or file_hash(src)
+        if self.touch(digest):
+            return digest
+        fd, tmp = self._tmp()
+        with os.fdopen(fd, "wb") as out, open(src, "rb") as f:
+            shutil.copyfileobj(f, out)
+        return self._commit(tmp, digest)
+
+    def put_bytes(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        if self.touch(digest):
+            return digest
+        fd, tmp = self._tmp()
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        return self._commit(tmp, digest)
+
+    def read_bytes(self, digest: str) -> bytes:
+        return self.path_for(digest).read_bytes()
+
+    def copy_to(self, digest: str, dest: Path):
+        # replace rather than overwrite: `dest` may share an inode with a tree snapshot
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.", suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(self.path_for(digest), tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, dest)
+
+    def iter_blobs(self):
+        """Yield (digest, path, stat) for every stored blob (temp files excluded)."""
+        if not self.root.exists():
+            return
+        for d in self.root.iterdir():
+            if d.is_dir() and len(d.name) == 2:
+                for p in d.iterdir():
+                    yield p.name, p, p.stat()
+
+    def delete(self, digest: str):
+        self.path_for(digest).unlink(missing_ok=True)
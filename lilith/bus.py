@@ -0,0 +1,76 @@
+from lilith.db import Step, Event
+from sqlalchemy import event as sa_event, inspect
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from contextvars import ContextVar
+import json, queue, threading
+
+# In-process pub/sub feeding the per-project SSE streams. Committed Event rows and Step
+# status changes are published automatically; tools publish live output with output().
+
+class Subscription:
+    def __init__(self, maxsize: int = 1000):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = False  # fell behind; the stream ends and the client resumes via Last-Event-ID
+
+_subs: dict = defaultdict(set)
+_lock = threading.Lock()
+
+def subscribe(project_id: int) -> Subscription:
+    sub = Subscription()
+    with _lock:
+        _subs[project_id].add(sub)
+    return sub
+
+def unsubscribe(project_id: int, sub: Subscription):
+    with _lock:
+        _subs[project_id].discard(sub)
+        if not _subs[project_id]:
+            del _subs[project_id]
+
+def publish(project_id: int | None, kind: str, data: dict, event_id: int | None = None):
+    with _lock:
+        subs = list(_subs.get(project_id, ()))
+    for sub in subs:
+        try:
+            sub.queue.put_nowait((kind, data, event_id))
+        except queue.Full:
+            sub.dropped = True
+            unsubscribe(project_id, sub)
+
+def output(project_id: int, step_id: int | None, stream: str, text: str):
+    """Live process output (stdout/stderr chunks) for a step; not persisted."""
+    publish(project_id, "output", {"step_id": step_id, "stream": stream, "text": text})
+
+# (project_id, step_id) of the step being applied in this context, for tools that stream output
+current_step: ContextVar = ContextVar("current_step", default=None)
+
+def event_message(e: Event) -> dict:
+    return {"id": e.id, "kind": e.kind, "step_id": e.step_id, "ts": e.ts.isoformat() if e.ts else None,
+            "payload": e.payload_json}
+
+def format_sse(kind: str, data: dict, event_id: int | None = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {kind}\ndata: {json.dumps(data, default=str)}\n\n"
+
+# Collect at flush (ids and defaults are known, attribute history still present),
+# publish only once the transaction commits.
+
+@sa_event.listens_for(Session, "after_flush")
+def _collect(session, ctx):
+    pending = session.info.setdefault("bus", [])
+    for obj in session.new:
+        if isinstance(obj, Event):
+            pending.append((obj.project_id, "event", event_message(obj), obj.id))
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Step) and inspect(obj).attrs.status.history.has_changes():
+            pending.append((obj.project_id, "step", {"id": obj.id, "status": obj.status}, None))
+
+@sa_event.listens_for(Session, "after_commit")
+def _flush_to_bus(session):
+    for project_id, kind, data, event_id in session.info.pop("bus", []):
+        publish(project_id, kind, data, event_id)
+
+@sa_event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("bus", None)
@@ -18,6 +18,31 @@ class Settings:
     temperature: float = float(_env("LLM_TEMPERATURE", "0.2"))
     timeout_s: int = int(_env("LLM_TIMEOUT_S", "40"))
     max_steps: int = int(_env("LLM_STEPS_MAX", "12"))
+    snapshot_backend: str = _env("LILITH_SNAPSHOT_BACKEND", "manifest") or "manifest"  # manifest|zip|tree
+    async_checkpoints: bool = (_env("LILITH_ASYNC_CHECKPOINTS", "1") or "1") not in ("0", "false", "no")
+    archive_level: int = int(_env("LILITH_ARCHIVE_LEVEL", "6"))  # zlib level for zip checkpoints
+    archive_workers: int = int(_env("LILITH_ARCHIVE_WORKERS", str(min(4, os.cpu_count() or 1))))
+    keep_last: int = int(_env("LILITH_KEEP_LAST", "10"))
+    keep_hourly: int = int(_env("LILITH_KEEP_HOURLY", "24"))
+    keep_daily: int = int(_env("LILITH_KEEP_DAILY", "7"))
+    checkpoint_budget_mb: int = int(_env("LILITH_CHECKPOINT_BUDGET_MB", "0"))  # per project; 0 = unlimited
+    sweep_interval_s: int = int(_env("LILITH_SWEEP_INTERVAL_S", "600"))  # 0 disables the sweeper
+    diff_max_kb: int = int(_env("LILITH_DIFF_MAX_KB", "256"))  # preview diff output cap; 0 = unlimited
+    diff_max_file_mb: int = int(_env("LILITH_DIFF_MAX_FILE_MB", "5"))  # larger files get a size/hash summary
+    preview_cache_entries: int = int(_env("LILITH_PREVIEW_CACHE_ENTRIES", "256"))  # 0 disables the Mirror cache
+    preview_cache_mb: int = int(_env("LILITH_PREVIEW_CACHE_MB", "32"))
+    apply_workers: int = int(_env("LILITH_APPLY_WORKERS", "4"))  # concurrent steps in a plan apply
+    job_workers: int = int(_env("LILITH_JOB_WORKERS", "2"))  # background job threads (one job per project at a time)
+    proc_workers: int = int(_env("LILITH_PROC_WORKERS", "2"))  # concurrent run_command/pip_install processes
+    proc_timeout_s: int = int(_env("LILITH_PROC_TIMEOUT_S", "300"))  # wall clock
+    proc_cpu_s: int = int(_env("LILITH_PROC_CPU_S", "120"))  # RLIMIT_CPU; 0 = unlimited
+    proc_mem_mb: int = int(_env("LILITH_PROC_MEM_MB", "2048"))  # RLIMIT_AS; 0 = unlimited
+    proc_output_kb: int = int(_env("LILITH_PROC_OUTPUT_KB", "256"))  # output kept per run (tail)
+    event_batch: int = int(_env("LILITH_EVENT_BATCH", "256"))  # buffered log events written per transaction
+    event_flush_ms: int = int(_env("LILITH_EVENT_FLUSH_MS", "250"))  # max delay before a buffered event is written
+    event_archive_days: int = int(_env("LILITH_EVENT_ARCHIVE_DAYS", "30"))  # older events move to archive/; 0 keeps all in the DB
+    payload_inline_kb: int = int(_env("LILITH_PAYLOAD_INLINE_KB", "16"))  # larger arg/event strings go to the blob store; 0 = inline
+    arg_max_kb: int = int(_env("LILITH_ARG_MAX_KB", "16384"))  # per string tool argument
 
 _settings: Settings | None = None
 def get_settings() -> Settings:
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON, Boolean, ForeignKey
+from sqlalchemy import create_engine, event, Column, Integer, BigInteger, String, Text, DateTime, JSON, Boolean, ForeignKey, \
+    UniqueConstraint, Index
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 from contextlib import contextmanager
 from datetime import datetime
@@ -7,10 +8,41 @@ from pathlib import Path
 Base = declarative_base()
 SessionLocal = None
 
+MIGRATIONS = Path(__file__).resolve().parent / "migrations"
+
+# Applied to every new connection. WAL lets the request threads read while a job writes;
+# synchronous=NORMAL is durable across app crashes in WAL mode (only an OS crash can lose
+# the last commits).
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,       # ms to wait on a locked database instead of failing
+    "cache_size": -32000,       # KiB (negative) of page cache per connection
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+def _set_pragmas(dbapi_conn, record):
+    cur = dbapi_conn.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cur.execute(f"PRAGMA {name}={value}")
+    cur.close()
+
+def migrate(engine, revision: str = "head"):
+    """Bring the schema up to `revision` with the Alembic scripts in lilith/migrations."""
+    from alembic import command
+    from alembic.config import Config
+    cfg = Config()
+    cfg.set_main_option("script_location", str(MIGRATIONS))
+    with engine.begin() as conn:
+        cfg.attributes["connection"] = conn
+        command.upgrade(cfg, revision)
+
 def init_db(db_path: Path):
     global SessionLocal
     engine = create_engine(f"sqlite:///{db_path}", echo=False, future=True)
-    Base.metadata.create_all(engine)
+    event.listen(engine, "connect", _set_pragmas)
+    migrate(engine)
     SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, autoflush=False, autocommit=False)
 
 @contextmanager
@@ -27,6 +59,7 @@ def session_scope():
 
 class Project(Base):
     __tablename__ = "projects"
+    __table_args__ = (Index("ix_projects_created", "created_at", "id"),)
     id = Column(Integer, primary_key=True)
     title = Column(String(200))
     goal = Column(Text)
@@ -37,6 +70,7 @@ class Project(Base):
 
 class Step(Base):
     __tablename__ = "steps"
+    __table_args__ = (Index("ix_steps_project_order", "project_id", "order_idx"),)
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey("projects.id"))
     title = Column(String(200))
@@ -52,6 +86,7 @@ class Step(Base):
 
 class Artifact(Base):
     __tablename__ = "artifacts"
+    __table_args__ = (Index("ix_artifacts_project_created", "project_id", "created_at"),)
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey("projects.id"))
     step_id = Column(Integer, ForeignKey("steps.id"))
@@ -62,6 +97,8 @@ class Artifact(Base):
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (Index("ix_events_project_ts", "project_id", "ts"),
+                      Index("ix_events_project_kind", "project_id", "kind"))
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey("projects.id"))
     step_id = Column(Integer, ForeignKey("steps.id"), nullable=True)
@@ -69,9 +106,71 @@ class Event(Base):
     payload_json = Column(JSON, default={})
     ts = Column(DateTime, default=datetime.utcnow)
 
+class EventSegment(Base):
+    """A gzip JSON-lines file of archived events of one project, in (ts, id) order."""
+    __tablename__ = "event_segments"
+    __table_args__ = (Index("ix_event_segments_project_last", "project_id", "last_ts", "last_id"),)
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
+    path = Column(String(500))
+    first_ts = Column(DateTime)
+    first_id = Column(Integer)
+    last_ts = Column(DateTime)
+    last_id = Column(Integer)
+    count = Column(Integer)
+    bytes = Column(BigInteger)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Checkpoint(Base):
     __tablename__ = "checkpoints"
+    __table_args__ = (Index("ix_checkpoints_project_ts", "project_id", "ts"),)
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey("projects.id"))
-    zip_path = Column(String(500))
+    zip_path = Column(String(500))  # .zip archive, .json blob manifest or .tree directory
     ts = Column(DateTime, default=datetime.utcnow)
+    size_bytes = Column(BigInteger, nullable=True)  # storage this checkpoint added (new blobs + manifest)
+
+class ProjectSummary(Base):
+    """Per-project counters, maintained by SQLite triggers (migration 0004); never written by the app.
+    The *_rev columns change with every write to their table and version the page fragments."""
+    __tablename__ = "project_summary"
+    project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True)
+    steps_total = Column(BigInteger, nullable=False, server_default="0")
+    steps_done = Column(BigInteger, nullable=False, server_default="0")  # done or applied
+    steps_pending = Column(BigInteger, nullable=False, server_default="0")
+    steps_error = Column(BigInteger, nullable=False, server_default="0")
+    artifacts = Column(BigInteger, nullable=False, server_default="0")
+    checkpoints = Column(BigInteger, nullable=False, server_default="0")
+    checkpoint_bytes = Column(BigInteger, nullable=False, server_default="0")
+    events = Column(BigInteger, nullable=False, server_default="0")
+    steps_rev = Column(BigInteger, nullable=False, server_default="0")
+    artifacts_rev = Column(BigInteger, nullable=False, server_default="0")
+    checkpoints_rev = Column(BigInteger, nullable=False, server_default="0")
+    events_rev = Column(BigInteger, nullable=False, server_default="0")
+
+class WorkspaceFile(Base):
+    __tablename__ = "workspace_files"
+    __table_args__ = (UniqueConstraint("project_id", "path"),)
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey("projects.id"))
+    path = Column(String(500))
+    size = Column(BigInteger)
+    mtime_ns = Column(BigInteger)
+    sha256 = Column(String(64))
+    hashed_ns = Column(BigInteger)  # when sha256 was computed; rows with mtime_ns >= hashed_ns are re-hashed
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status", "status", "id"), Index("ix_jobs_project", "project_id", "id"))
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
+    kind = Column(String(64))
+    args_json = Column(JSON, default={})
+    status = Column(String(32), default="queued")  # queued | running | done | error
+    progress_json = Column(JSON, default={})
+    result_json = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
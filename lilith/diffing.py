@@ -0,0 +1,231 @@
+from bisect import bisect_left
+import hashlib
+
+# Line diff for the Mirror: lines are interned to ints, common prefix/suffix trimmed,
+# then patience anchoring (lines unique on both sides) splits the problem into small
+# gaps that a bounded Myers O(ND) pass resolves. Gaps that exceed the edit budget are
+# reported as a plain replace instead of going quadratic.
+
+MYERS_MAX_D = 400
+BINARY_SNIFF = 8192
+
+def is_binary(data: bytes) -> bool:
+    if b"\0" in data[:BINARY_SNIFF]:
+        return True
+    try:
+        data.decode("utf-8")
+    except UnicodeDecodeError:
+        return True
+    return False
+
+def _myers(a, b, alo, ahi, blo, bhi, max_d):
+    """Matching (i, j) pairs of a[alo:ahi] vs b[blo:bhi], or None if more than max_d edits."""
+    n, m = ahi - alo, bhi - blo
+    v = {1: 0}
+    trace = []
+    for d in range(min(n + m, max_d) + 1):
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v.get(k - 1, -1) < v.get(k + 1, -1)):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m, alo, blo)
+    return None
+
+def _backtrack(trace, x, y, alo, blo):
+    pairs = []
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v.get(k - 1, -1) < v.get(k + 1, -1)):
+            pk = k + 1
+        else:
+            pk = k - 1
+        px = v.get(pk, 0)
+        py = px - pk
+        while x > px and y > py:
+            x -= 1
+            y -= 1
+            pairs.append((alo + x, blo + y))
+        if d > 0:
+            x, y = px, py
+    pairs.reverse()
+    return pairs
+
+def _unique_anchors(a, b, alo, ahi, blo, bhi):
+    ca, cb = {}, {}
+    for i in range(alo, ahi):
+        ca[a[i]] = i if a[i] not in ca else -1
+    for j in range(blo, bhi):
+        cb[b[j]] = j if b[j] not in cb else -1
+    pairs = sorted((i, cb[x]) for x, i in ca.items() if i >= 0 and cb.get(x, -1) >= 0)
+    # longest increasing subsequence on j (patience sorting)
+    tails, tails_idx, prev = [], [], [None] * len(pairs)
+    for idx, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tails_idx.append(idx)
+        else:
+            tails[pos] = j
+            tails_idx[pos] = idx
+        prev[idx] = tails_idx[pos - 1] if pos else None
+    out = []
+    idx = tails_idx[-1] if tails_idx else None
+    while idx is not None:
+        out.append(pairs[idx])
+        idx = prev[idx]
+    out.reverse()
+    return out
+
+def matching_blocks(a: list, b: list) -> list:
+    """Like SequenceMatcher.get_matching_blocks(): [(i, j, n), ..., (len(a), len(b), 0)]."""
+    intern = {}
+    a = [intern.setdefault(x, len(intern)) for x in a]
+    b = [intern.setdefault(x, len(intern)) for x in b]
+    pairs = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            pairs.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            pairs.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+        if anchors:
+            pi, pj = alo, blo
+            for i, j in anchors:
+                pairs.append((i, j))
+                stack.append((pi, i, pj, j))
+                pi, pj = i + 1, j + 1
+            stack.append((pi, ahi, pj, bhi))
+        else:
+            pairs.extend(_myers(a, b, alo, ahi, blo, bhi, MYERS_MAX_D) or [])
+    pairs.sort()
+    blocks = []
+    for i, j in pairs:
+        if blocks and blocks[-1][0] + blocks[-1][2] == i and blocks[-1][1] + blocks[-1][2] == j:
+            blocks[-1][2] += 1
+        else:
+            blocks.append([i, j, 1])
+    return [tuple(x) for x in blocks] + [(len(a), len(b), 0)]
+
+def opcodes(a: list, b: list) -> list:
+    i = j = 0
+    out = []
+    for ai, bj, size in matching_blocks(a, b):
+        tag = "replace" if i < ai and j < bj else "delete" if i < ai else "insert" if j < bj else ""
+        if tag:
+            out.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            out.append(("equal", ai, i, bj, j))
+    return out
+
+def _grouped(codes: list, n: int = 3):
+    # same grouping as difflib.SequenceMatcher.get_grouped_opcodes
+    if not codes:
+        codes = [("equal", 0, 1, 0, 1)]
+    if codes[0][0] == "equal":
+        t, i1, i2, j1, j2 = codes[0]
+        codes[0] = t, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == "equal":
+        t, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = t, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    nn = n + n
+    group = []
+    for t, i1, i2, j1, j2 in codes:
+        if t == "equal" and i2 - i1 > nn:
+            group.append((t, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((t, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+def _range(start, stop):
+    beginning, length = start + 1, stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+def _line(prefix: str, line: str) -> str:
+    if line.endswith("\n"):
+        return prefix + line
+    return prefix + line + "\n\\ No newline at end of file\n"
+
+def iter_unified_diff(before: str, after: str, rel: str, context: int = 3):
+    """Stream a unified diff of two texts line by line."""
+    a = before.splitlines(keepends=True)
+    b = after.splitlines(keepends=True)
+    started = False
+    for group in _grouped(opcodes(a, b), context):
+        if not started:
+            started = True
+            yield f"--- a/{rel}\n"
+            yield f"+++ b/{rel}\n"
+        first, last = group[0], group[-1]
+        yield f"@@ -{_range(first[1], last[2])} +{_range(first[3], last[4])} @@\n"
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield _line(" ", line)
+                continue
+            for line in a[i1:i2]:
+                yield _line("-", line)
+            for line in b[j1:j2]:
+                yield _line("+", line)
+
+def capped(lines, max_bytes: int):
+    """Pass lines through until `max_bytes`, then a truncation marker."""
+    used = 0
+    it = iter(lines)
+    for line in it:
+        used += len(line)
+        if max_bytes and used > max_bytes:
+            rest = 1 + sum(1 for _ in it)
+            yield f"... diff truncated: {rest} more line(s) not shown ...\n"
+            return
+        yield line
+
+def _summary(rel: str, before: bytes | None, after: bytes | None, reason: str) -> str:
+    def side(d):
+        return "absent" if d is None else f"{len(d)} bytes, sha256 {hashlib.sha256(d).hexdigest()[:12]}"
+    if before == after:
+        return ""
+    return f"{reason} a/{rel} and b/{rel} differ ({side(before)} -> {side(after)})\n"
+
+def iter_diff(before: bytes | None, after: bytes | None, rel: str, max_bytes: int = 256 * 1024,
+              max_file_bytes: int = 5 * 1024 * 1024, context: int = 3):
+    """Streaming diff of two file versions (None = file absent). Binary or oversized files
+    yield a one-line size/hash summary; text diffs stop at `max_bytes` with a marker."""
+    if any(d is not None and is_binary(d) for d in (before, after)):
+        yield _summary(rel, before, after, "Binary files")
+        return
+    if max_file_bytes and max(len(before or b""), len(after or b"")) > max_file_bytes:
+        yield _summary(rel, before, after, "Large files")
+        return
+    yield from capped(iter_unified_diff((before or b"").decode("utf-8"), (after or b"").decode("utf-8"),
+                                        rel, context), max_bytes)
+
+def diff_bytes(before: bytes | None, after: bytes | None, rel: str, **caps) -> str:
+    return "".join(iter_diff(before, after, rel, **caps))
+
+def diff_text(before: str, after: str, rel: str, **caps) -> str:
+    return diff_bytes(before.encode("utf-8"), after.encode("utf-8"), rel, **caps)
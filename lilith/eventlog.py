@@ -0,0 +1,136 @@
+from pathlib import Path
+from datetime import datetime, timedelta
+from functools import lru_cache
+from sqlalchemy import and_, or_
+from lilith.db import Event, EventSegment, session_scope
+from lilith.background import start_periodic
+from lilith import bus, payloads
+import gzip, json, os, tempfile
+
+# Event history, newest first, by (ts, id) keyset cursor. Old events are moved out of the
+# hot table into gzip JSON-lines segments (one row per file in event_segments); page()
+# merges both, so the API and the "Load older" button do not care where an event lives.
+
+ARCHIVE = Path(__file__).resolve().parent.parent / "archive" / "events"
+KEEP_KINDS = ("applied", "undone")  # undo history and blob GC read these from the hot table
+SEGMENT_EVENTS = 5000
+MAX_PAGE = 200
+
+def _of_project(col, project_id):
+    return col.is_(None) if project_id is None else col == project_id
+
+def _key(ev: dict) -> tuple:
+    return datetime.fromisoformat(ev["ts"]), ev["id"]
+
+def cursor(ev: dict) -> str:
+    return f"{ev['ts']}|{ev['id']}"
+
+def parse_cursor(value: str | None) -> tuple | None:
+    """(ts, id) from a cursor string; raises ValueError when malformed."""
+    if not value:
+        return None
+    ts, _, event_id = value.rpartition("|")
+    return datetime.fromisoformat(ts), int(event_id)
+
+def _before(ts_col, id_col, before: tuple):
+    ts, event_id = before
+    return or_(ts_col < ts, and_(ts_col == ts, id_col < event_id))
+
+def _hot(project_id, before, limit: int) -> list[dict]:
+    with session_scope() as s:
+        q = s.query(Event).filter(_of_project(Event.project_id, project_id))
+        if before:
+            q = q.filter(_before(Event.ts, Event.id, before))
+        return [bus.event_message(e) for e in q.order_by(Event.ts.desc(), Event.id.desc()).limit(limit)]
+
+@lru_cache(maxsize=16)
+def _read_segment(path: str) -> tuple:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return tuple(json.loads(line) for line in f)
+
+def _cold(project_id, before, limit: int, floor: tuple | None) -> list[dict]:
+    # segments newest first; stop once `limit` events are in hand. Only events above `floor`
+    # can still make the page, so with a full hot page most segments are never opened.
+    with session_scope() as s:
+        q = s.query(EventSegment).filter(_of_project(EventSegment.project_id, project_id))
+        if before:
+            q = q.filter(_before(EventSegment.first_ts, EventSegment.first_id, before))
+        if floor:
+            q = q.filter(or_(EventSegment.last_ts > floor[0],
+                             and_(EventSegment.last_ts == floor[0], EventSegment.last_id > floor[1])))
+        segs = q.order_by(EventSegment.last_ts.desc(), EventSegment.last_id.desc()).all()
+    out = []
+    for seg in segs:
+        for ev in reversed(_read_segment(seg.path)):
+            k = _key(ev)
+            if (before is None or k < before) and (floor is None or k > floor):
+                out.append(ev)
+        if len(out) >= limit:
+            break
+    return out
+
+def page(project_id: int | None, before: str | None = None, limit: int = 50) -> tuple[list[dict], str | None]:
+    """One page of events older than the `before` cursor, and the cursor of the next page (or None)."""
+    limit = max(1, min(limit, MAX_PAGE))
+    before = parse_cursor(before)
+    hot = _hot(project_id, before, limit + 1)
+    # a full hot page bounds what archived events could still belong on it
+    floor = _key(hot[limit - 1]) if len(hot) > limit else None
+    merged = sorted(hot + _cold(project_id, before, limit + 1, floor), key=_key, reverse=True)
+    events = merged[:limit]
+    return events, cursor(events[-1]) if len(merged) > limit else None
+
+def _write_segment(project_id, events: list[dict]) -> Path:
+    d = ARCHIVE / (str(project_id) if project_id is not None else "_global")
+    d.mkdir(parents=True, exist_ok=True)
+    dest = d / f"{events[0]['id']}-{events[-1]['id']}.jsonl.gz"
+    fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            for ev in events:
+                f.write(json.dumps(ev, default=str).encode("utf-8") + b"\n")
+        os.replace(tmp, dest)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return dest
+
+def _inline(payload):
+    # segments are self-contained: offloaded strings go back in (and compress with the rest)
+    try:
+        return payloads.hydrate(payload)
+    except FileNotFoundError:
+        return payload
+
+def archive(older_than: timedelta, now: datetime | None = None) -> dict:
+    """Move events older than `older_than` (except KEEP_KINDS) into segment files."""
+    cutoff = (now or datetime.utcnow()) - older_than
+    old = and_(Event.ts < cutoff, Event.kind.notin_(KEEP_KINDS))
+    stats = {"segments": 0, "events": 0, "bytes": 0}
+    with session_scope() as s:
+        project_ids = [pid for (pid,) in s.query(Event.project_id).filter(old).distinct()]
+    for pid in project_ids:
+        while True:
+            # file first, then row + delete in one transaction: a crash leaves an unlisted file, never a gap
+            with session_scope() as s:
+                rows = s.query(Event).filter(_of_project(Event.project_id, pid), old) \
+                        .order_by(Event.ts.asc(), Event.id.asc()).limit(SEGMENT_EVENTS).all()
+                if not rows:
+                    break
+                events = [{**bus.event_message(e), "payload": _inline(e.payload_json)} for e in rows]
+                path = _write_segment(pid, events)
+                size = path.stat().st_size
+                s.add(EventSegment(project_id=pid, path=str(path), count=len(rows), bytes=size,
+                                   first_ts=rows[0].ts, first_id=rows[0].id, last_ts=rows[-1].ts, last_id=rows[-1].id))
+                s.query(Event).filter(Event.id.in_([e.id for e in rows])).delete(synchronize_session=False)
+            stats["segments"] += 1
+            stats["events"] += len(rows)
+            stats["bytes"] += size
+            if len(rows) < SEGMENT_EVENTS:
+                break
+    return stats
+
+def start_archiver(older_than_days: int, interval_s: float):
+    if older_than_days <= 0:
+        return None
+    return start_periodic("event-archiver", interval_s, lambda: archive(timedelta(days=older_than_days)))
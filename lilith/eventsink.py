@@ -0,0 +1,89 @@
+from lilith.db import Event, session_scope
+from lilith.config import get_settings
+from datetime import datetime
+import atexit, logging, threading
+
+# Log-only events (checkpoint, plan_applied, restored, ...) go through SINK instead of a
+# transaction each: rows are buffered and written as one multi-row INSERT per batch. Events
+# that must commit together with other rows (applied + undo journal, step status) still use
+# session_scope directly. The ORM path keeps the bus and payload offloading listeners working.
+
+log = logging.getLogger(__name__)
+
+class EventSink:
+    """Buffer Event rows; write them when `max_batch` are pending or `max_delay_s` after the first."""
+
+    def __init__(self, max_batch: int = 256, max_delay_s: float = 0.25):
+        self.max_batch = max_batch
+        self.max_delay_s = max_delay_s
+        self._buf: list[dict] = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # one writer at a time keeps batches in emit order
+        self._thread = None
+        self._closed = False
+        self.written = self.batches = 0
+
+    def emit(self, project_id: int | None, kind: str, payload: dict | None = None, step_id: int | None = None):
+        row = {"project_id": project_id, "step_id": step_id, "kind": kind,
+               "payload_json": payload or {}, "ts": datetime.utcnow()}
+        with self._cond:
+            self._buf.append(row)
+            closed = self._closed
+            if not closed:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="event-sink", daemon=True)
+                    self._thread.start()
+                if len(self._buf) >= self.max_batch:
+                    self._cond.notify()
+        if closed:
+            self.flush()  # shutting down: nobody is left to write it later
+
+    def flush(self) -> int:
+        """Write everything emitted so far before returning; the durability barrier for callers."""
+        with self._write_lock:
+            with self._cond:
+                rows, self._buf = self._buf, []
+            if not rows:
+                return 0
+            try:
+                with session_scope() as s:
+                    s.add_all([Event(**r) for r in rows])
+            except Exception:
+                with self._cond:
+                    self._buf[:0] = rows  # keep them for the next attempt
+                raise
+            self.written += len(rows)
+            self.batches += 1
+            return len(rows)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._buf)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._buf or self._closed)
+                if self._closed:
+                    return
+                self._cond.wait_for(lambda: len(self._buf) >= self.max_batch or self._closed,
+                                    timeout=self.max_delay_s)
+            try:
+                self.flush()
+            except Exception:
+                log.exception("event batch failed; retrying")
+                with self._cond:
+                    self._cond.wait(timeout=1.0)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        try:
+            self.flush()
+        except Exception:
+            log.exception("final event flush failed")
+
+_settings = get_settings()
+SINK = EventSink(_settings.event_batch, _settings.event_flush_ms / 1000)
+atexit.register(SINK.close)
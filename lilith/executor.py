@@ -1,57 +1,305 @@
 ﻿from lilith.registry import TOOL_REGISTRY, ToolError
-from lilith.utils import ensure_safe_args
-from lilith.db import Checkpoint, session_scope
+from lilith.db import Step, Artifact, Checkpoint, Event, session_scope
+from lilith.blobs import BlobStore
+from lilith.journal import UndoJournal, replay
+from lilith.snapshots import make_backends, backend_for, unshare_files
+from lilith.retention import pinned, pin, unpin
+from lilith.config import get_settings
+from lilith import fileindex, bus, payloads
+from lilith.eventsink import SINK
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from collections import defaultdict
 from pathlib import Path
-import shutil, zipfile, time, os
+import threading, time
 
-def apply_tool(step, workspace: Path):
+def apply_tool(step, workspace: Path, journal: UndoJournal | None = None):
     tool = TOOL_REGISTRY.get(step.tool)
     if not tool:
         raise ToolError(f"Unknown tool: {step.tool}")
-    args = step.args_json or {}
-    ensure_safe_args(args)
-    result = tool.apply(workspace, args)
+    tool.validate(workspace, step.args_json or {})
+    args = payloads.hydrate(step.args_json or {})
+    if tool.writes_in_place:
+        # staged checkpoints and hardlinked tree snapshots share inodes with the workspace:
+        # let pending checkpoints finish (dropping their staging links), then copy what is still shared
+        wait_checkpoints(step.project_id)
+        unshare_files(workspace, tool.touches(args))
+    token = bus.current_step.set((step.project_id, step.id))
+    try:
+        result = tool.apply(workspace, args, journal=journal)
+    finally:
+        bus.current_step.reset(token)
+    _index_writes(step.project_id, workspace, result, journal)
     return result
 
-def checkpoint_now(project_id: int, workspace: Path) -> Path:
-    cp_dir = Path(__file__).resolve().parent.parent / "checkpoints" / str(project_id)
-    cp_dir.mkdir(parents=True, exist_ok=True)
-    ts = str(int(time.time()))
-    zip_path = cp_dir / f"{ts}.zip"
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        for root, dirs, files in os.walk(workspace):
-            for f in files:
-                p = Path(root) / f
-                zf.write(p, p.relative_to(workspace))
+def _index_writes(project_id: int, workspace: Path, result: dict, journal: UndoJournal | None):
+    # keep the file index current with what the tool just wrote, reusing the hashes it reported
+    hashes = {a["path"]: a.get("hash") or None for a in result.get("artifacts", []) if a.get("type") == "file"}
+    for e in (journal.entries if journal else []):
+        hashes.setdefault(e["path"], None)
+    for rel, sha in hashes.items():
+        fileindex.record(project_id, workspace, rel, sha)
+
+CHECKPOINTS = Path(__file__).resolve().parent.parent / "checkpoints"
+BLOBS = BlobStore(CHECKPOINTS / "_blobs")
+SNAPSHOT_BACKENDS = make_backends(BLOBS, get_settings())
+
+def _latest_checkpoint(project_id: int):
     with session_scope() as s:
-        s.add(Checkpoint(project_id=project_id, zip_path=str(zip_path)))
-    return zip_path
+        return s.query(Checkpoint).filter(Checkpoint.project_id==project_id).order_by(Checkpoint.id.desc()).first()
+
+# A single finalizer keeps checkpoints of a project durable in capture order.
+_FINALIZER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+_pending: dict[int, set] = defaultdict(set)
+_pending_lock = threading.Lock()
+
+def _record_checkpoint(project_id: int, cp_path: Path, stats: dict, t0: float) -> tuple[Path, dict]:
+    with session_scope() as s:
+        s.add(Checkpoint(project_id=project_id, zip_path=str(cp_path), size_bytes=stats.get("bytes_out")))
+    stats.setdefault("wall_ms", round((time.perf_counter() - t0) * 1000, 1))
+    return cp_path, {"backend": get_settings().snapshot_backend, **stats}
+
+def begin_checkpoint(project_id: int, workspace: Path) -> Future:
+    """Freeze the current workspace state and return a Future of (path, stats).
+
+    With async checkpoints and a backend that supports staging, only a stat walk and
+    links of changed files happen here; hashing and blob copies run on the finalizer.
+    The Checkpoint row exists once the Future resolves.
+    """
+    t0 = time.perf_counter()
+    cp_dir = CHECKPOINTS / str(project_id)
+    cp_dir.mkdir(parents=True, exist_ok=True)
+    backend = SNAPSHOT_BACKENDS[get_settings().snapshot_backend]
+    # the previous checkpoint lets incremental backends skip unchanged files
+    last = _latest_checkpoint(project_id)
+    previous = Path(last.zip_path) if last and last.zip_path else None
+    cp_path = cp_dir / f"{time.time_ns()}{backend.suffix}"
+    known = fileindex.entries(project_id)
+    if not (get_settings().async_checkpoints and hasattr(backend, "stage")):
+        fut = Future()
+        try:
+            stats = backend.capture(workspace, cp_path, previous=previous, known=known)
+            fut.set_result(_record_checkpoint(project_id, cp_path, stats, t0))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+    # staged entries reference blobs of `previous`; keep the sweeper away from both until durable
+    held = [p for p in (previous, cp_path, cp_path.with_suffix(".staging")) if p]
+    for p in held:
+        pin(p)
+    try:
+        pending = backend.stage(workspace, cp_path, previous=previous, known=known)
+    except Exception:
+        for p in held:
+            unpin(p)
+        raise
+    stage_ms = round((time.perf_counter() - t0) * 1000, 1)
+
+    def _finalize():
+        try:
+            stats = backend.finalize(pending, cp_path)
+            return _record_checkpoint(project_id, cp_path, {**stats, "stage_ms": stage_ms}, t0)
+        finally:
+            for p in held:
+                unpin(p)
+
+    fut = _FINALIZER.submit(_finalize)
+    with _pending_lock:
+        _pending[project_id].add(fut)
+    fut.add_done_callback(lambda f: _forget(project_id, f))
+    return fut
+
+def _forget(project_id: int, fut: Future):
+    with _pending_lock:
+        _pending[project_id].discard(fut)
+
+def wait_checkpoints(project_id: int, timeout: float | None = None):
+    """Barrier: block until every checkpoint begun for `project_id` is durable (or failed)."""
+    with _pending_lock:
+        futs = list(_pending[project_id])
+    wait(futs, timeout=timeout)
+
+def checkpoint_now(project_id: int, workspace: Path) -> tuple[Path, dict]:
+    """Snapshot `workspace`; returns the checkpoint path and capture stats (bytes in/out, wall time)."""
+    return begin_checkpoint(project_id, workspace).result()
 
 def rollback_last(project_id: int, workspace: Path):
-    cp_dir = Path(__file__).resolve().parent.parent / "checkpoints" / str(project_id)
-    if not cp_dir.exists():
-        return False
-    zips = sorted(cp_dir.glob("*.zip"), reverse=True)
-    if not zips:
-        return False
-    latest = zips[0]
-    # wipe workspace then restore
-    if workspace.exists():
-        shutil.rmtree(workspace)
-    workspace.mkdir(parents=True, exist_ok=True)
-    with zipfile.ZipFile(latest, "r") as zf:
-        zf.extractall(workspace)
-    return True
-
-
-# --- Lilith Fix Pack: apply_tool dispatcher ---
+    wait_checkpoints(project_id)
+    last = _latest_checkpoint(project_id)
+    if last and last.zip_path and Path(last.zip_path).exists():
+        latest = Path(last.zip_path)
+    else:
+        # checkpoints written before they were tracked in the DB
+        cp_dir = CHECKPOINTS / str(project_id)
+        zips = sorted(cp_dir.glob("*.zip"), reverse=True) if cp_dir.exists() else []
+        if not zips:
+            return False
+        latest = zips[0]
+    with pinned(latest):
+        stats = backend_for(latest, SNAPSHOT_BACKENDS).restore(latest, workspace, known=fileindex.entries(project_id))
+    fileindex.rescan(project_id, workspace)
+    return stats
+
+def restore_checkpoint(checkpoint_id: int, workspace: Path) -> dict:
+    """Restore any checkpoint by id, writing/deleting only the files that differ."""
+    with session_scope() as s:
+        cp = s.get(Checkpoint, checkpoint_id)
+    if cp is None or not cp.zip_path:
+        raise ToolError(f"Checkpoint {checkpoint_id} not found")
+    path = Path(cp.zip_path)
+    with pinned(path):
+        if not path.exists():
+            raise ToolError(f"Checkpoint {checkpoint_id} not found")
+        stats = backend_for(path, SNAPSHOT_BACKENDS).restore(path, workspace, known=fileindex.entries(cp.project_id))
+    fileindex.rescan(cp.project_id, workspace)
+    return {"checkpoint_id": checkpoint_id, **stats}
+
+def new_journal(workspace: Path) -> UndoJournal:
+    return UndoJournal(workspace, BLOBS)
+
+def run_step(step_id: int, workspace: Path, timing: dict | None = None) -> dict:
+    """Apply one step and record the outcome: status "applied", an `applied` event carrying the
+    undo journal and timing, and artifacts; or, for any exception, status "error" and an `error`
+    event, then re-raise."""
+    with session_scope() as s:
+        st = s.get(Step, step_id)
+    journal = new_journal(workspace)
+    t0 = time.perf_counter()
+    try:
+        result = apply_tool(st, workspace, journal=journal)
+    except Exception as e:
+        timing = {**(timing or {}), "wall_ms": round((time.perf_counter() - t0) * 1000, 1)}
+        error = str(e) if isinstance(e, ToolError) else f"{type(e).__name__}: {e}"
+        with session_scope() as s:
+            s.get(Step, step_id).status = "error"
+            s.add(Event(project_id=st.project_id, step_id=step_id, kind="error",
+                        payload_json={"error": error, "timing": timing}))
+        raise
+    timing = {**(timing or {}), "wall_ms": round((time.perf_counter() - t0) * 1000, 1)}
+    with session_scope() as s:
+        _record_applied(s, st, result, journal, timing)
+    return result
+
+def _record_applied(s, step, result: dict, journal: UndoJournal, timing: dict):
+    s.get(Step, step.id).status = "applied"  # -> "done" once the checkpoint is durable
+    s.add(Event(project_id=step.project_id, step_id=step.id, kind="applied",
+                payload_json={**result, "undo": journal.entries, "timing": timing}))
+    for a in result.get("artifacts", []):
+        s.add(Artifact(project_id=step.project_id, step_id=step.id, type=a.get("type","file"),
+                       uri=a.get("path"), hash=a.get("hash","")))
+
+def _unwind(project_id: int, workspace: Path, journals: list) -> list:
+    restored = []
+    for journal in reversed(journals):
+        restored += replay(workspace, journal.entries, BLOBS)
+    restored = list(dict.fromkeys(restored))
+    for rel in restored:
+        fileindex.record(project_id, workspace, rel)
+    return restored
+
+def apply_batch(project_id: int, step_ids: list, workspace: Path) -> dict:
+    """Apply `step_ids` in order behind a single checkpoint, all or nothing.
+
+    A ToolError unwinds the steps already applied through their undo journals and only the
+    failing step is marked "error"; on success every status, event and artifact is written
+    in one transaction.
+    """
+    t0 = time.perf_counter()
+    with session_scope() as s:
+        steps = {st.id: st for st in s.query(Step).filter(Step.project_id==project_id, Step.id.in_(step_ids))}
+    missing = [sid for sid in step_ids if sid not in steps]
+    if missing:
+        raise ToolError(f"Steps not in project {project_id}: {missing}")
+    cp = begin_checkpoint(project_id, workspace)
+    done = []  # (step, result, journal, timing)
+    try:
+        for sid in step_ids:
+            journal = new_journal(workspace)
+            done.append((steps[sid], None, journal, None))
+            ts = time.perf_counter()
+            result = apply_tool(steps[sid], workspace, journal=journal)
+            done[-1] = (steps[sid], result, journal, {"wall_ms": round((time.perf_counter() - ts) * 1000, 1)})
+        with session_scope() as s:
+            for step, result, journal, timing in done:
+                _record_applied(s, step, result, journal, timing)
+            s.add(Event(project_id=project_id, kind="batch_applied",
+                        payload_json={"steps": step_ids, "wall_ms": round((time.perf_counter() - t0) * 1000, 1)}))
+    except ToolError as e:
+        restored = _unwind(project_id, workspace, [j for _, _, j, _ in done])
+        failed = done[-1][0].id
+        with session_scope() as s:
+            s.get(Step, failed).status = "error"
+            s.add(Event(project_id=project_id, step_id=failed, kind="error",
+                        payload_json={"error": str(e), "batch": step_ids, "rolled_back": restored}))
+        cp.add_done_callback(lambda f: settle_checkpoint(project_id, [], f))
+        return {"ok": False, "failed": failed, "error": str(e), "rolled_back": restored}
+    except Exception:
+        _unwind(project_id, workspace, [j for _, _, j, _ in done])
+        cp.add_done_callback(lambda f: settle_checkpoint(project_id, [], f))
+        raise
+    cp.add_done_callback(lambda f: settle_checkpoint(project_id, step_ids, f))
+    return {"ok": True, "applied": step_ids, "wall_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+def settle_checkpoint(project_id: int, step_ids: list, fut: Future):
+    """Done-callback for the checkpoint taken before `step_ids` ran: log it and move them to done.
+    A failed checkpoint leaves them "applied" (no rollback point) and logs `checkpoint_failed`."""
+    step_id = step_ids[0] if len(step_ids) == 1 else None
+    try:
+        cp_path, cp_stats = fut.result()
+    except Exception as e:
+        SINK.emit(project_id, "checkpoint_failed", {"error": str(e), "steps": step_ids}, step_id=step_id)
+        return
+    SINK.emit(project_id, "checkpoint", {"path": str(cp_path), "stats": cp_stats, "steps": step_ids}, step_id=step_id)
+    if not step_ids:
+        return
+    with session_scope() as s:
+        for st in s.query(Step).filter(Step.id.in_(step_ids), Step.status=="applied"):
+            st.status = "done"
+
+def _undo_history(project_id: int):
+    # applied/undone events, newest first; an applied event is live until a later undone event names it
+    with session_scope() as s:
+        evs = s.query(Event).filter(Event.project_id==project_id, Event.kind.in_(["applied", "undone"])) \
+            .order_by(Event.id.desc()).all()
+    undone = {e.payload_json.get("event_id") for e in evs if e.kind == "undone"}
+    return [e for e in evs if e.kind == "applied" and e.id not in undone and "undo" in (e.payload_json or {})]
+
+def undo_step(project_id: int, step_id: int, workspace: Path) -> dict:
+    """Replay the undo journal of the latest live apply of `step_id`."""
+    live = _undo_history(project_id)
+    target = next((e for e in live if e.step_id == step_id), None)
+    if target is None:
+        raise ToolError(f"Nothing to undo for step {step_id}")
+    paths = {u["path"] for u in target.payload_json["undo"]}
+    for later in live:
+        if later.id <= target.id:
+            break
+        if paths & {u["path"] for u in later.payload_json["undo"]}:
+            raise ToolError(f"Step {later.step_id} changed the same files after step {step_id}; undo it first")
+    restored = replay(workspace, target.payload_json["undo"], BLOBS)
+    for rel in restored:
+        fileindex.record(project_id, workspace, rel)
+    return {"event_id": target.id, "step_id": step_id, "restored": restored}
+
+def undo_last(project_id: int, workspace: Path) -> dict | None:
+    live = _undo_history(project_id)
+    if not live:
+        return None
+    return undo_step(project_id, live[0].step_id, workspace)
+
+
+# --- Lilith Fix Pack: action dispatcher ---
+# (named apply_action so it does not shadow the step-based apply_tool above)
 from lilith.registry import TOOL_REGISTRY, ToolError as _LF_ToolError
 
-def apply_tool(action: dict):
+def apply_action(action: dict):
     name = action.get("name")
     args = action.get("args", {}) or {}
     if name not in TOOL_REGISTRY:
         raise _LF_ToolError(f"Unknown tool: {name}")
     fn = TOOL_REGISTRY[name]
+    if hasattr(fn, "apply"):
+        # manifest tools (run_command, pip_install) run against the current directory
+        fn.validate(Path.cwd(), args)
+        return fn.apply(Path.cwd(), args)
     return fn(**args)
-# --- end Fix Pack block ---
+# --- end Fix Pack block ---
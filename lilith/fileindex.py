@@ -0,0 +1,92 @@
+from pathlib import Path
+from lilith.db import WorkspaceFile, session_scope
+from lilith.snapshots import walk_files
+from lilith.utils import file_hash, safe_join
+import time
+
+# Per-project index of workspace files (path, size, mtime_ns, sha256). Tools keep it
+# current through record(); rescan() catches out-of-band edits by stat alone and only
+# re-hashes files whose size or mtime moved.
+
+def _fresh(row: WorkspaceFile, st) -> bool:
+    # same size and mtime, and hashed strictly after the last modification (not racily clean)
+    return row.size == st.st_size and row.mtime_ns == st.st_mtime_ns and st.st_mtime_ns < row.hashed_ns
+
+def _fill(row: WorkspaceFile, p: Path, st, sha256: str | None = None):
+    row.size, row.mtime_ns = st.st_size, st.st_mtime_ns
+    row.hashed_ns = time.time_ns()
+    row.sha256 = sha256 or file_hash(p)
+
+def rescan(project_id: int, workspace: Path) -> dict:
+    stats = {"files": 0, "hashed": 0, "removed": 0}
+    with session_scope() as s:
+        rows = {r.path: r for r in s.query(WorkspaceFile).filter(WorkspaceFile.project_id==project_id)}
+        if workspace.exists():
+            for rel, p, st in walk_files(workspace):
+                stats["files"] += 1
+                row = rows.pop(rel, None)
+                if row is not None and _fresh(row, st):
+                    continue
+                if row is None:
+                    row = WorkspaceFile(project_id=project_id, path=rel)
+                    s.add(row)
+                _fill(row, p, st)
+                stats["hashed"] += 1
+        for row in rows.values():
+            s.delete(row)
+            stats["removed"] += 1
+    return stats
+
+def record(project_id: int, workspace: Path, rel: str, sha256: str | None = None):
+    """Update one entry after a write (or removal); pass the hash when the writer already knows it."""
+    p = safe_join(workspace, rel)
+    rel = p.relative_to(workspace.resolve()).as_posix()
+    with session_scope() as s:
+        row = s.query(WorkspaceFile).filter(WorkspaceFile.project_id==project_id, WorkspaceFile.path==rel).first()
+        if not p.is_file():
+            if row is not None:
+                s.delete(row)
+            return
+        if row is None:
+            row = WorkspaceFile(project_id=project_id, path=rel)
+            s.add(row)
+        _fill(row, p, p.stat(), sha256)
+
+def lookup(project_id: int, workspace: Path, rel: str) -> str | None:
+    """sha256 of a workspace file, from the index when its stat still matches (else re-hashed)."""
+    p = safe_join(workspace, rel)
+    rel = p.relative_to(workspace.resolve()).as_posix()
+    with session_scope() as s:
+        row = s.query(WorkspaceFile).filter(WorkspaceFile.project_id==project_id, WorkspaceFile.path==rel).first()
+        if not p.is_file():
+            if row is not None:
+                s.delete(row)
+            return None
+        st = p.stat()
+        if row is not None and _fresh(row, st):
+            return row.sha256
+        if row is None:
+            row = WorkspaceFile(project_id=project_id, path=rel)
+            s.add(row)
+        _fill(row, p, st)
+        return row.sha256
+
+def entries(project_id: int) -> dict:
+    """Indexed files as {path: (size, mtime_ns, sha256, hashed_ns)}, without touching disk."""
+    with session_scope() as s:
+        q = s.query(WorkspaceFile.path, WorkspaceFile.size, WorkspaceFile.mtime_ns,
+                    WorkspaceFile.sha256, WorkspaceFile.hashed_ns).filter(WorkspaceFile.project_id==project_id)
+        return {path: (size, mtime_ns, sha, hashed_ns) for path, size, mtime_ns, sha, hashed_ns in q}
+
+def tree(project_id: int) -> list[dict]:
+    """Sorted listing for the workspace view: [{path, depth, name, size, sha256}] with directory rows."""
+    out, seen_dirs = [], set()
+    for path, (size, _, sha, _) in sorted(entries(project_id).items()):
+        parts = path.split("/")
+        for i in range(1, len(parts)):
+            d = "/".join(parts[:i])
+            if d not in seen_dirs:
+                seen_dirs.add(d)
+                out.append({"path": d, "depth": i - 1, "name": parts[i - 1] + "/", "size": None, "sha256": None})
+        out.append({"path": path, "depth": len(parts) - 1, "name": parts[-1], "size": size, "sha256": sha})
+    return out
@@ -0,0 +1,118 @@
+from lilith.db import Job, session_scope
+from lilith.registry import ToolError
+from lilith.eventsink import SINK
+from sqlalchemy import select, update, or_, func
+from datetime import datetime
+import logging, threading
+
+# SQLite-backed job queue worked by a local thread pool. Routes enqueue and return the job
+# id; rows outlive the process, and jobs left "running" by a crash are requeued on start.
+# Jobs of one project run one at a time, in enqueue order.
+
+log = logging.getLogger(__name__)
+HANDLERS: dict = {}
+_wake = threading.Condition()
+_claim_lock = threading.Lock()
+
+def handler(kind: str):
+    """Register `fn(args, job_id) -> dict` as the runner for jobs of `kind`."""
+    def deco(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return deco
+
+def enqueue(kind: str, args: dict, project_id: int | None = None) -> int:
+    with session_scope() as s:
+        job = Job(kind=kind, args_json=args, project_id=project_id, status="queued")
+        s.add(job)
+        s.flush()
+        job_id = job.id
+    with _wake:
+        _wake.notify()
+    return job_id
+
+def get(job_id: int) -> Job | None:
+    with session_scope() as s:
+        return s.get(Job, job_id)
+
+def recent(project_id: int, limit: int = 10) -> list:
+    with session_scope() as s:
+        return s.query(Job).filter(Job.project_id==project_id).order_by(Job.id.desc()).limit(limit).all()
+
+def progress(job_id: int, **info):
+    with session_scope() as s:
+        s.get(Job, job_id).progress_json = info
+
+def _claim() -> Job | None:
+    # other processes may work the same table: the conditional UPDATE is the claim, and one
+    # that lost the race (rowcount 0) picks again; the lock only saves this process retries
+    with _claim_lock:
+        while True:
+            with session_scope() as s:
+                busy = select(Job.project_id).where(Job.status=="running", Job.project_id.isnot(None))
+                claimable = (Job.status=="queued", or_(Job.project_id.is_(None), Job.project_id.notin_(busy)))
+                job_id = s.query(Job.id).filter(*claimable).order_by(Job.id.asc()).limit(1).scalar()
+                if job_id is None:
+                    return None
+                claimed = s.execute(update(Job).where(Job.id==job_id, *claimable)
+                                    .values(status="running", started_at=datetime.utcnow(),
+                                            attempts=func.coalesce(Job.attempts, 0) + 1)).rowcount
+                if claimed:
+                    return s.get(Job, job_id)
+
+def _finish(job_id: int, **fields):
+    try:
+        SINK.flush()  # a finished job's events are readable once its status says so
+    except Exception:
+        log.exception("event flush for job %s failed", job_id)
+    with session_scope() as s:
+        s.execute(update(Job).where(Job.id==job_id).values(finished_at=datetime.utcnow(), **fields))
+    with _wake:
+        _wake.notify_all()  # a project's next job may be claimable now
+
+def _run(job: Job):
+    fn = HANDLERS.get(job.kind)
+    try:
+        if fn is None:
+            raise ToolError(f"No handler for job kind {job.kind!r}")
+        result = fn(job.args_json or {}, job.id)
+    except ToolError as e:
+        _finish(job.id, status="error", error=str(e))
+        return
+    except Exception as e:
+        log.exception("job %s (%s) failed", job.id, job.kind)
+        _finish(job.id, status="error", error=str(e))
+        return
+    _finish(job.id, status="done", result_json=result)
+
+def _loop(stop: threading.Event):
+    while not stop.is_set():
+        try:
+            job = _claim()
+        except Exception:
+            log.exception("job claim failed")
+            job = None
+        if job is None:
+            with _wake:
+                _wake.wait(timeout=1.0)
+            continue
+        try:
+            _run(job)
+        except Exception:
+            log.exception("job %s bookkeeping failed", job.id)
+
+def start_workers(n: int) -> threading.Event:
+    """Requeue jobs interrupted by a restart and start `n` daemon workers; set the Event to stop."""
+    with session_scope() as s:
+        s.execute(update(Job).where(Job.status=="running").values(status="queued"))
+    stop = threading.Event()
+    for i in range(max(1, n)):
+        threading.Thread(target=_loop, args=(stop,), name=f"job-worker-{i}", daemon=True).start()
+    return stop
+
+def as_dict(job: Job) -> dict:
+    return {"id": job.id, "kind": job.kind, "project_id": job.project_id, "status": job.status,
+            "progress": job.progress_json or {}, "result": job.result_json, "error": job.error,
+            "attempts": job.attempts, "created_at": job.created_at and job.created_at.isoformat(),
+            "started_at": job.started_at and job.started_at.isoformat(),
+            "finished_at": job.finished_at and job.finished_at.isoformat()}
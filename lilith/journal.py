@@ -0,0 +1,35 @@
+from pathlib import Path
+from lilith.blobs import BlobStore
+from lilith.utils import safe_join, prune_empty_dirs
+
+class UndoJournal:
+    """Reverse deltas for one tool apply: the prior blob (or None if absent) of each path it touches."""
+
+    def __init__(self, workspace: Path, store: BlobStore):
+        self.workspace = workspace.resolve()
+        self.store = store
+        self.entries: list[dict] = []
+        self._seen: set[str] = set()
+
+    def record(self, target: Path):
+        # must be called before `target` is modified; only the first call per path counts
+        rel = Path(target).resolve().relative_to(self.workspace).as_posix()
+        if rel in self._seen:
+            return
+        self._seen.add(rel)
+        digest = self.store.put_file(target) if target.is_file() else None
+        self.entries.append({"path": rel, "blob": digest})
+
+def replay(workspace: Path, entries: list[dict], store: BlobStore) -> list[str]:
+    """Undo a journal in O(touched files): restore prior blobs, delete files that did not exist."""
+    restored = []
+    for e in reversed(entries):
+        target = safe_join(workspace, e["path"])
+        if e["blob"] is None:
+            if target.exists():
+                target.unlink()
+            prune_empty_dirs(target.parent, workspace)
+        else:
+            store.copy_to(e["blob"], target)
+        restored.append(e["path"])
+    return restored
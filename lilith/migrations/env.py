@@ -0,0 +1,32 @@
+from alembic import context
+from sqlalchemy import create_engine
+from lilith.db import Base
+
+# Run by db.migrate() with an open connection, or from the CLI (`alembic upgrade head`
+# with alembic.ini in the repo root), which connects to sqlalchemy.url.
+
+config = context.config
+target_metadata = Base.metadata
+
+def _include_name(name, type_, parent_names):
+    # the FTS5 table (and its shadow tables) is managed by hand in 0005, not by the models
+    return not (type_ == "table" and name.startswith("project_fts"))
+
+def _run(connection):
+    # batch mode: SQLite can only ALTER by copying the table
+    context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True,
+                      include_name=_include_name)
+    with context.begin_transaction():
+        context.run_migrations()
+
+if context.is_offline_mode():
+    context.configure(url=config.get_main_option("sqlalchemy.url"), target_metadata=target_metadata,
+                      literal_binds=True, render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+elif config.attributes.get("connection") is not None:
+    _run(config.attributes["connection"])
+else:
+    with create_engine(config.get_main_option("sqlalchemy.url")).connect() as conn:
+        _run(conn)
+        conn.commit()
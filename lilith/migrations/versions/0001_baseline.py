@@ -0,0 +1,97 @@
+"""baseline: the tables create_all() used to make
+
+Databases created before migrations already have some or all of these tables; only the
+missing ones are created, so the first upgrade adopts an existing lilith.db as is.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+TABLES = {
+    "projects": lambda: [
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("title", sa.String(200)),
+        sa.Column("goal", sa.Text),
+        sa.Column("status", sa.String(32)),
+        sa.Column("created_at", sa.DateTime),
+    ],
+    "steps": lambda: [
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("project_id", sa.Integer, sa.ForeignKey("projects.id")),
+        sa.Column("title", sa.String(200)),
+        sa.Column("desc", sa.Text),
+        sa.Column("required", sa.Boolean),
+        sa.Column("status", sa.String(32)),
+        sa.Column("order_idx", sa.Integer),
+        sa.Column("tool", sa.String(64)),
+        sa.Column("args_json", sa.JSON),
+        sa.Column("depends_on", sa.JSON),
+    ],
+    "artifacts": lambda: [
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("project_id", sa.Integer, sa.ForeignKey("projects.id")),
+        sa.Column("step_id", sa.Integer, sa.ForeignKey("steps.id")),
+        sa.Column("type", sa.String(32)),
+        sa.Column("uri", sa.String(500)),
+        sa.Column("hash", sa.String(128)),
+        sa.Column("created_at", sa.DateTime),
+    ],
+    "events": lambda: [
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("project_id", sa.Integer, sa.ForeignKey("projects.id")),
+        sa.Column("step_id", sa.Integer, sa.ForeignKey("steps.id"), nullable=True),
+        sa.Column("kind", sa.String(64)),
+        sa.Column("payload_json", sa.JSON),
+        sa.Column("ts", sa.DateTime),
+    ],
+    "checkpoints": lambda: [
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("project_id", sa.Integer, sa.ForeignKey("projects.id")),
+        sa.Column("zip_path", sa.String(500)),
+        sa.Column("ts", sa.DateTime),
+    ],
+    "workspace_files": lambda: [
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("project_id", sa.Integer, sa.ForeignKey("projects.id")),
+        sa.Column("path", sa.String(500)),
+        sa.Column("size", sa.BigInteger),
+        sa.Column("mtime_ns", sa.BigInteger),
+        sa.Column("sha256", sa.String(64)),
+        sa.Column("hashed_ns", sa.BigInteger),
+        sa.UniqueConstraint("project_id", "path"),
+    ],
+    "jobs": lambda: [
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("project_id", sa.Integer, sa.ForeignKey("projects.id"), nullable=True),
+        sa.Column("kind", sa.String(64)),
+        sa.Column("args_json", sa.JSON),
+        sa.Column("status", sa.String(32)),
+        sa.Column("progress_json", sa.JSON),
+        sa.Column("result_json", sa.JSON, nullable=True),
+        sa.Column("error", sa.Text, nullable=True),
+        sa.Column("attempts", sa.Integer),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("started_at", sa.DateTime, nullable=True),
+        sa.Column("finished_at", sa.DateTime, nullable=True),
+    ],
+}
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    for name, columns in TABLES.items():
+        if name not in existing:
+            op.create_table(name, *columns())
+
+
+def downgrade():
+    for name in reversed(list(TABLES)):
+        op.drop_table(name)
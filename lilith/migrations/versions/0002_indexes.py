@@ -0,0 +1,32 @@
+"""composite indexes for the per-project filters and orderings
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_steps_project_order", "steps", ["project_id", "order_idx"]),
+    ("ix_artifacts_project_created", "artifacts", ["project_id", "created_at"]),
+    ("ix_events_project_ts", "events", ["project_id", "ts"]),
+    ("ix_events_project_kind", "events", ["project_id", "kind"]),
+    ("ix_checkpoints_project_ts", "checkpoints", ["project_id", "ts"]),
+    ("ix_jobs_status", "jobs", ["status", "id"]),
+    ("ix_jobs_project", "jobs", ["project_id", "id"]),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
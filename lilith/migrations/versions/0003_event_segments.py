@@ -0,0 +1,35 @@
+"""event_segments: archived events in compressed per-project files
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "event_segments",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("project_id", sa.Integer, sa.ForeignKey("projects.id"), nullable=True),
+        sa.Column("path", sa.String(500)),
+        sa.Column("first_ts", sa.DateTime),
+        sa.Column("first_id", sa.Integer),
+        sa.Column("last_ts", sa.DateTime),
+        sa.Column("last_id", sa.Integer),
+        sa.Column("count", sa.Integer),
+        sa.Column("bytes", sa.BigInteger),
+        sa.Column("created_at", sa.DateTime),
+    )
+    op.create_index("ix_event_segments_project_last", "event_segments", ["project_id", "last_ts", "last_id"])
+
+
+def downgrade():
+    op.drop_index("ix_event_segments_project_last", table_name="event_segments")
+    op.drop_table("event_segments")
@@ -0,0 +1,93 @@
+"""project_summary: per-project counters kept by triggers; checkpoints.size_bytes
+
+The *_rev columns move whenever a section of the project page changes and back the
+ETags of its fragments.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+COUNTERS = ["steps_total", "steps_done", "steps_pending", "steps_error", "artifacts", "checkpoints",
+            "checkpoint_bytes", "events", "steps_rev", "artifacts_rev", "checkpoints_rev", "events_rev"]
+
+DONE = "IN ('done', 'applied')"
+
+def _ensure(ref):
+    return f"INSERT OR IGNORE INTO project_summary (project_id) VALUES ({ref}.project_id);"
+
+def _bump(ref, sets):
+    return f"UPDATE project_summary SET {sets} WHERE project_id = {ref}.project_id;"
+
+def _steps(ref, sign):
+    return (f"steps_total = steps_total {sign} 1, "
+            f"steps_done = steps_done {sign} ({ref}.status {DONE}), "
+            f"steps_pending = steps_pending {sign} (COALESCE({ref}.status, 'pending') = 'pending'), "
+            f"steps_error = steps_error {sign} ({ref}.status = 'error')")
+
+TRIGGERS = {
+    "summary_steps_ins": f"AFTER INSERT ON steps BEGIN {_ensure('NEW')} "
+                         f"{_bump('NEW', _steps('NEW', '+') + ', steps_rev = steps_rev + 1')} END",
+    "summary_steps_upd": f"AFTER UPDATE ON steps BEGIN {_ensure('NEW')} "
+                         f"{_bump('OLD', _steps('OLD', '-'))} "
+                         f"{_bump('NEW', _steps('NEW', '+') + ', steps_rev = steps_rev + 1')} END",
+    "summary_steps_del": f"AFTER DELETE ON steps BEGIN "
+                         f"{_bump('OLD', _steps('OLD', '-') + ', steps_rev = steps_rev + 1')} END",
+    "summary_artifacts_ins": f"AFTER INSERT ON artifacts BEGIN {_ensure('NEW')} "
+                             f"{_bump('NEW', 'artifacts = artifacts + 1, artifacts_rev = artifacts_rev + 1')} END",
+    "summary_artifacts_del": f"AFTER DELETE ON artifacts BEGIN "
+                             f"{_bump('OLD', 'artifacts = artifacts - 1, artifacts_rev = artifacts_rev + 1')} END",
+    "summary_checkpoints_ins": f"AFTER INSERT ON checkpoints BEGIN {_ensure('NEW')} "
+                               f"{_bump('NEW', 'checkpoints = checkpoints + 1, checkpoint_bytes = checkpoint_bytes + COALESCE(NEW.size_bytes, 0), checkpoints_rev = checkpoints_rev + 1')} END",
+    "summary_checkpoints_upd": f"AFTER UPDATE ON checkpoints BEGIN "
+                               f"{_bump('NEW', 'checkpoint_bytes = checkpoint_bytes - COALESCE(OLD.size_bytes, 0) + COALESCE(NEW.size_bytes, 0), checkpoints_rev = checkpoints_rev + 1')} END",
+    "summary_checkpoints_del": f"AFTER DELETE ON checkpoints BEGIN "
+                               f"{_bump('OLD', 'checkpoints = checkpoints - 1, checkpoint_bytes = checkpoint_bytes - COALESCE(OLD.size_bytes, 0), checkpoints_rev = checkpoints_rev + 1')} END",
+    "summary_events_ins": f"AFTER INSERT ON events WHEN NEW.project_id IS NOT NULL BEGIN {_ensure('NEW')} "
+                          f"{_bump('NEW', 'events = events + 1, events_rev = events_rev + 1')} END",
+    "summary_events_del": f"AFTER DELETE ON events WHEN OLD.project_id IS NOT NULL BEGIN "
+                          f"{_bump('OLD', 'events = events - 1, events_rev = events_rev + 1')} END",
+}
+
+BACKFILL = f"""
+INSERT INTO project_summary (project_id, steps_total, steps_done, steps_pending, steps_error,
+                             artifacts, checkpoints, checkpoint_bytes, events)
+SELECT p.id,
+       (SELECT COUNT(*) FROM steps WHERE project_id = p.id),
+       (SELECT COUNT(*) FROM steps WHERE project_id = p.id AND status {DONE}),
+       (SELECT COUNT(*) FROM steps WHERE project_id = p.id AND COALESCE(status, 'pending') = 'pending'),
+       (SELECT COUNT(*) FROM steps WHERE project_id = p.id AND status = 'error'),
+       (SELECT COUNT(*) FROM artifacts WHERE project_id = p.id),
+       (SELECT COUNT(*) FROM checkpoints WHERE project_id = p.id),
+       0,
+       (SELECT COUNT(*) FROM events WHERE project_id = p.id)
+FROM projects p
+"""
+
+
+def upgrade():
+    with op.batch_alter_table("checkpoints") as batch:
+        batch.add_column(sa.Column("size_bytes", sa.BigInteger, nullable=True))
+    op.create_table(
+        "project_summary",
+        sa.Column("project_id", sa.Integer, sa.ForeignKey("projects.id"), primary_key=True),
+        *[sa.Column(name, sa.BigInteger, nullable=False, server_default="0") for name in COUNTERS],
+    )
+    op.execute(BACKFILL)
+    for name, body in TRIGGERS.items():
+        op.execute(f"CREATE TRIGGER {name} {body}")
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.drop_table("project_summary")
+    with op.batch_alter_table("checkpoints") as batch:
+        batch.drop_column("size_bytes")
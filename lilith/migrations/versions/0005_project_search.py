@@ -0,0 +1,59 @@
+"""project_fts: FTS5 index over project titles, goals, step titles and event kinds
+
+One row per project (rowid = projects.id), kept in sync by triggers. Also indexes
+projects(created_at, id) for the keyset-paginated project list.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+STEP_TITLES = "(SELECT COALESCE(group_concat(title, ' '), '') FROM steps WHERE project_id = {ref}.project_id)"
+
+TRIGGERS = {
+    "fts_projects_ins": "AFTER INSERT ON projects BEGIN "
+                        "INSERT INTO project_fts (rowid, title, goal, steps, events) "
+                        "VALUES (NEW.id, COALESCE(NEW.title, ''), COALESCE(NEW.goal, ''), '', ''); END",
+    "fts_projects_upd": "AFTER UPDATE OF title, goal ON projects BEGIN "
+                        "UPDATE project_fts SET title = COALESCE(NEW.title, ''), goal = COALESCE(NEW.goal, '') "
+                        "WHERE rowid = NEW.id; END",
+    "fts_projects_del": "AFTER DELETE ON projects BEGIN DELETE FROM project_fts WHERE rowid = OLD.id; END",
+    "fts_steps_ins": f"AFTER INSERT ON steps BEGIN UPDATE project_fts SET steps = {STEP_TITLES.format(ref='NEW')} "
+                     "WHERE rowid = NEW.project_id; END",
+    "fts_steps_upd": f"AFTER UPDATE OF title ON steps BEGIN UPDATE project_fts SET steps = {STEP_TITLES.format(ref='NEW')} "
+                     "WHERE rowid = NEW.project_id; END",
+    "fts_steps_del": f"AFTER DELETE ON steps BEGIN UPDATE project_fts SET steps = {STEP_TITLES.format(ref='OLD')} "
+                     "WHERE rowid = OLD.project_id; END",
+    # kinds are a small set per project: only a kind not seen before rewrites the row
+    "fts_events_ins": "AFTER INSERT ON events WHEN NEW.project_id IS NOT NULL BEGIN "
+                      "UPDATE project_fts SET events = trim(events || ' ' || NEW.kind) "
+                      "WHERE rowid = NEW.project_id AND instr(' ' || events || ' ', ' ' || NEW.kind || ' ') = 0; END",
+}
+
+
+def upgrade():
+    op.create_index("ix_projects_created", "projects", ["created_at", "id"])
+    op.execute("CREATE VIRTUAL TABLE project_fts USING fts5("
+               "title, goal, steps, events, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+    op.execute("""
+        INSERT INTO project_fts (rowid, title, goal, steps, events)
+        SELECT p.id, COALESCE(p.title, ''), COALESCE(p.goal, ''),
+               (SELECT COALESCE(group_concat(title, ' '), '') FROM steps WHERE project_id = p.id),
+               (SELECT COALESCE(group_concat(kind, ' '), '') FROM (SELECT DISTINCT kind FROM events WHERE project_id = p.id))
+        FROM projects p
+    """)
+    for name, body in TRIGGERS.items():
+        op.execute(f"CREATE TRIGGER {name} {body}")
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS project_fts")
+    op.drop_index("ix_projects_created", table_name="projects")
@@ -1,11 +1,109 @@
-from lilith.registry import TOOL_REGISTRY, ToolError
-from lilith.utils import ensure_safe_args
+from lilith.registry import TOOL_REGISTRY, ToolError, preview_changes
+from lilith.overlay import OverlayFS
+from lilith.config import get_settings
+from lilith import fileindex, payloads
+from collections import OrderedDict
 from pathlib import Path
+import hashlib, json, threading, time
+
+class PreviewCache:
+    """Bounded LRU of dry-run results, limited by entry count and approximate JSON size."""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self._items: OrderedDict = OrderedDict()  # key -> (result, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, result: dict):
+        size = len(json.dumps(result, default=str))
+        if not self.max_entries or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (result, size)
+            self._bytes += size
+            while len(self._items) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._items),
+                    "bytes": self._bytes, "max_entries": self.max_entries, "max_bytes": self.max_bytes}
+
+_settings = get_settings()
+PREVIEW_CACHE = PreviewCache(_settings.preview_cache_entries, _settings.preview_cache_mb * 1024 * 1024)
+
+def _cache_key(step, tool, workspace: Path, args: dict):
+    reads = tool.reads(args)
+    if reads is None:
+        return None
+    args_hash = hashlib.sha256(json.dumps(args, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    # content hashes from the file index: any write to an input changes the key
+    inputs = tuple((rel, fileindex.lookup(step.project_id, workspace, rel)) for rel in sorted(reads))
+    return (step.tool, args_hash, inputs)
 
 def run_mirror(step, workspace: Path):
     tool = TOOL_REGISTRY.get(step.tool)
     if not tool:
         raise ToolError(f"Unknown tool: {step.tool}")
     args = step.args_json or {}
-    ensure_safe_args(args)
-    return tool.dry_run(workspace, args)
+    tool.validate(workspace, args)
+    # keyed on the stored args: offloaded values are already content hashes, so a hit loads nothing
+    key = _cache_key(step, tool, workspace, args)
+    if key is not None:
+        cached = PREVIEW_CACHE.get(key)
+        if cached is not None:
+            return dict(cached)
+    result = tool.dry_run(workspace, payloads.hydrate(args))
+    if key is not None:
+        PREVIEW_CACHE.put(key, result)
+    return dict(result)
+
+def run_plan_mirror(steps: list, workspace: Path) -> dict:
+    """Dry-run every step in order against one in-memory overlay; nothing touches disk."""
+    t0 = time.perf_counter()
+    fs = OverlayFS(workspace)
+    results = []
+    for step in steps:
+        r = {"step_id": step.id, "title": step.title, "tool": step.tool}
+        tool = TOOL_REGISTRY.get(step.tool)
+        try:
+            if not tool:
+                raise ToolError(f"Unknown tool: {step.tool}")
+            tool.validate(workspace, step.args_json or {})
+            args = payloads.hydrate(step.args_json or {})
+            try:
+                tool.simulate(fs, args)
+            except NotImplementedError:
+                if tool.side_effects.get("fs"):
+                    raise ToolError("Tool cannot be simulated; mirror this step on its own")
+                r["preview_log"] = tool.dry_run(workspace, args).get("preview_log")
+        except ToolError as e:
+            r["error"] = str(e)
+            r["errors"] = getattr(e, "errors", None)
+        results.append(r)
+    out = preview_changes(fs)
+    out["steps"] = results
+    out["wall_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return out
@@ -0,0 +1,139 @@
+from collections import deque
+import re
+
+# Multi-pattern search/replace for bulk_replace. All literal patterns are matched in one
+# Aho-Corasick pass per line (leftmost-longest, non-overlapping); regex patterns then run
+# on the same line. Files are streamed line by line, so patterns cannot span lines.
+
+class AhoCorasick:
+    def __init__(self, patterns: list[str]):
+        self.patterns = patterns
+        self.goto: list[dict] = [{}]
+        self.fail: list[int] = [0]
+        self.out: list[tuple] = [()]  # patterns ending at this state, own first then via fail links
+        for i, p in enumerate(patterns):
+            s = 0
+            for ch in p:
+                nxt = self.goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[s][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                s = nxt
+            if not self.out[s]:
+                self.out[s] = (i,)
+        q = deque(self.goto[0].values())
+        while q:
+            s = q.popleft()
+            for ch, nxt in self.goto[s].items():
+                f = self.fail[s]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                if s:
+                    self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] += self.out[self.fail[nxt]]
+                q.append(nxt)
+
+    def matches(self, text: str) -> list[tuple]:
+        """Leftmost-longest, non-overlapping (start, end, pattern index) matches."""
+        found = []
+        s = 0
+        goto, fail, out, patterns = self.goto, self.fail, self.out, self.patterns
+        for i, ch in enumerate(text):
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            for pid in out[s]:
+                found.append((i + 1 - len(patterns[pid]), i + 1, pid))
+        found.sort(key=lambda m: (m[0], m[0] - m[1]))
+        chosen, pos = [], 0
+        for start, end, pid in found:
+            if start >= pos:
+                chosen.append((start, end, pid))
+                pos = end
+        return chosen
+
+class Replacer:
+    """Compiled replacement set: [{"search", "replace", "regex": bool}]."""
+
+    def __init__(self, replacements: list[dict]):
+        literals = [r for r in replacements if not r.get("regex")]
+        for r in replacements:
+            if not r.get("search"):
+                raise ValueError("Empty search pattern")
+            if not r.get("regex") and ("\n" in r["search"] or "\r" in r["search"]):
+                raise ValueError("Literal patterns cannot span lines")
+        self.literals = AhoCorasick([r["search"] for r in literals]) if literals else None
+        self.literal_repl = [r.get("replace", "") for r in literals]
+        self.regexes = [(re.compile(r["search"]), r.get("replace", "")) for r in replacements if r.get("regex")]
+
+    def line(self, text: str) -> tuple[str, int]:
+        count = 0
+        if self.literals is not None:
+            ms = self.literals.matches(text)
+            if ms:
+                parts, pos = [], 0
+                for start, end, pid in ms:
+                    parts.append(text[pos:start])
+                    parts.append(self.literal_repl[pid])
+                    pos = end
+                parts.append(text[pos:])
+                text = "".join(parts)
+                count += len(ms)
+        for rx, repl in self.regexes:
+            text, n = rx.subn(repl, text)
+            count += n
+        return text, count
+
+    def text(self, text: str) -> tuple[str, int]:
+        out, total = [], 0
+        for line in text.splitlines(keepends=True):
+            new, n = self.line(line)
+            out.append(new)
+            total += n
+        return "".join(out), total
+
+    def stream(self, src, dst) -> tuple[int, bool]:
+        """Copy text file object `src` to `dst` line by line, replacing; returns (count, changed)."""
+        total, changed = 0, False
+        for line in src:
+            new, n = self.line(line)
+            dst.write(new)
+            total += n
+            changed = changed or new != line
+        return total, changed
+
+def glob_regex(pattern: str) -> re.Pattern:
+    """Workspace-relative glob: `*` and `?` stay within a path segment, `**/` spans directories."""
+    out, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(out) + r"\Z")
+
+def glob_root(pattern: str) -> str | None:
+    """Literal directory prefix of a glob ("site/**/*.html" -> "site"), or None when it has
+    none and may match anywhere (including the empty pattern)."""
+    parts = []
+    for part in pattern.split("/"):
+        if any(c in part for c in "*?["):
+            break
+        parts.append(part)
+    else:
+        return pattern or None
+    return "/".join(parts) or None
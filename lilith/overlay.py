@@ -0,0 +1,58 @@
+from pathlib import Path
+from lilith.utils import safe_join
+from lilith.snapshots import walk_files
+
+_DELETED = object()
+
+class OverlayFS:
+    """Copy-on-write view of a workspace: reads fall through to disk, writes stay in memory."""
+
+    def __init__(self, workspace: Path):
+        self.workspace = workspace.resolve()
+        self._layer: dict = {}  # rel -> bytes | _DELETED
+        self._base: dict = {}   # rel -> bytes | None, disk content at first touch
+
+    def _rel(self, rel) -> str:
+        return safe_join(self.workspace, rel).relative_to(self.workspace).as_posix()
+
+    def _disk(self, rel: str) -> bytes | None:
+        if rel not in self._base:
+            p = self.workspace / rel
+            self._base[rel] = p.read_bytes() if p.is_file() else None
+        return self._base[rel]
+
+    def read_bytes(self, rel) -> bytes | None:
+        rel = self._rel(rel)
+        if rel in self._layer:
+            data = self._layer[rel]
+            return None if data is _DELETED else data
+        return self._disk(rel)
+
+    def exists(self, rel) -> bool:
+        return self.read_bytes(rel) is not None
+
+    def write_bytes(self, rel, data: bytes):
+        rel = self._rel(rel)
+        self._disk(rel)
+        self._layer[rel] = data
+
+    def write_text(self, rel, text: str):
+        self.write_bytes(rel, text.encode("utf-8"))
+
+    def delete(self, rel):
+        rel = self._rel(rel)
+        self._disk(rel)
+        self._layer[rel] = _DELETED
+
+    def glob(self, rx) -> list[str]:
+        """Existing paths (disk or overlay) whose relative posix path matches compiled `rx`."""
+        found = {rel for rel, _, _ in walk_files(self.workspace) if rx.match(rel)} if self.workspace.exists() else set()
+        for rel, data in self._layer.items():
+            if rx.match(rel):
+                (found.discard if data is _DELETED else found.add)(rel)
+        return sorted(found)
+
+    def touched(self) -> list[tuple]:
+        """[(rel, before, after)] for every path written or deleted, in path order; None = absent."""
+        return [(rel, self._base[rel], None if data is _DELETED else data)
+                for rel, data in sorted(self._layer.items())]
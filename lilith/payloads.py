@@ -0,0 +1,87 @@
+from pathlib import Path
+from sqlalchemy import event as sa_event, cast, Text
+from lilith.db import Step, Event, session_scope
+from lilith.blobs import BlobStore
+from lilith.config import get_settings
+import time
+
+# Large strings in Step.args_json and Event.payload_json (file contents, command output)
+# are moved into a content-addressed store on flush; the row keeps {"$blob": sha, "size": n}.
+# Readers that need the text (apply, Mirror) call hydrate(); listings never load it.
+
+PAYLOADS = BlobStore(Path(__file__).resolve().parent.parent / "payloads")
+REF = "$blob"
+
+def is_ref(v) -> bool:
+    return isinstance(v, dict) and REF in v and len(v) <= 2
+
+def offload(value, threshold: int, store: BlobStore = PAYLOADS):
+    """Copy of `value` with every string longer than `threshold` bytes replaced by a blob ref."""
+    if isinstance(value, str):
+        if len(value) * 4 <= threshold:  # cannot exceed the threshold even as 4-byte UTF-8
+            return value
+        data = value.encode("utf-8")
+        if len(data) <= threshold:
+            return value
+        return {REF: store.put_bytes(data), "size": len(data)}
+    if isinstance(value, dict):
+        if is_ref(value):
+            return value
+        return {k: offload(v, threshold, store) for k, v in value.items()}
+    if isinstance(value, list):
+        return [offload(v, threshold, store) for v in value]
+    return value
+
+def hydrate(value, store: BlobStore = PAYLOADS):
+    """Inverse of offload(): read referenced blobs back into strings."""
+    if isinstance(value, dict):
+        if is_ref(value):
+            return store.read_bytes(value[REF]).decode("utf-8")
+        return {k: hydrate(v, store) for k, v in value.items()}
+    if isinstance(value, list):
+        return [hydrate(v, store) for v in value]
+    return value
+
+def refs(value, out: set | None = None) -> set:
+    out = set() if out is None else out
+    if isinstance(value, dict):
+        if is_ref(value):
+            out.add(value[REF])
+        else:
+            for v in value.values():
+                refs(v, out)
+    elif isinstance(value, list):
+        for v in value:
+            refs(v, out)
+    return out
+
+def _offload_attr(attr: str):
+    def listener(mapper, connection, target):
+        threshold = get_settings().payload_inline_kb * 1024
+        value = getattr(target, attr)
+        if threshold and value:
+            slim = offload(value, threshold)
+            if slim != value:  # leave the attribute (and the UPDATE) alone when nothing moved
+                setattr(target, attr, slim)
+    return listener
+
+for _model, _attr in ((Step, "args_json"), (Event, "payload_json")):
+    sa_event.listen(_model, "before_insert", _offload_attr(_attr))
+    sa_event.listen(_model, "before_update", _offload_attr(_attr))
+
+def collect(grace_s: int, store: BlobStore = PAYLOADS) -> dict:
+    """Delete payload blobs no step or event references any more (older than `grace_s`)."""
+    cutoff = time.time() - grace_s
+    removed = freed = 0
+    with store.lock:
+        live = set()
+        with session_scope() as s:
+            for col in (Step.args_json, Event.payload_json):
+                for (value,) in s.query(col).filter(cast(col, Text).like(f'%"{REF}"%')):
+                    refs(value, live)
+        for digest, p, st in store.iter_blobs():
+            if digest not in live and st.st_mtime < cutoff:
+                store.delete(digest)
+                removed += 1
+                freed += st.st_size
+    return {"blobs": removed, "bytes": freed}
@@ -0,0 +1,153 @@
+from lilith.config import get_settings
+from collections import deque
+from pathlib import Path
+import codecs, os, signal, subprocess, threading, time
+
+try:
+    import resource
+except ImportError:  # Windows: wall-clock timeout only
+    resource = None
+
+# Managed subprocesses for tools: bounded concurrency, wall-clock timeout, CPU/memory
+# rlimits, output pumped incrementally into a capped buffer (and to a callback for live
+# streaming), and cancellation by key.
+
+class OutputBuffer:
+    """Keeps the last `max_chars` of output; older text is dropped and counted."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.chunks = deque()
+        self.size = self.total = 0
+        self.lock = threading.Lock()
+
+    def append(self, text: str):
+        with self.lock:
+            self.chunks.append(text)
+            self.size += len(text)
+            self.total += len(text)
+            while self.size > self.max_chars:
+                head = self.chunks.popleft()
+                over = self.size - self.max_chars
+                if len(head) > over:
+                    self.chunks.appendleft(head[over:])
+                    self.size -= over
+                else:
+                    self.size -= len(head)
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > self.size
+
+    def text(self) -> str:
+        with self.lock:
+            body = "".join(self.chunks)
+            if self.total > self.size:
+                return f"[... {self.total - self.size} earlier characters dropped ...]\n" + body
+            return body
+
+_slots = threading.BoundedSemaphore(max(1, get_settings().proc_workers))
+_running: dict = {}
+_running_lock = threading.Lock()
+
+def _limiter(cpu_s: int, mem_mb: int):
+    """preexec_fn setting the rlimits in the child before exec, so it never runs unlimited."""
+    if resource is None or not (cpu_s or mem_mb):
+        return None
+    limits = []
+    if cpu_s:
+        limits.append((resource.RLIMIT_CPU, cpu_s, cpu_s + 5))
+    if mem_mb:
+        limits.append((resource.RLIMIT_AS, mem_mb * 1024 * 1024, mem_mb * 1024 * 1024))
+
+    def apply():
+        for res, soft, hard in limits:
+            try:
+                cap = resource.getrlimit(res)[1]
+                if cap != resource.RLIM_INFINITY:
+                    soft, hard = min(soft, cap), min(hard, cap)  # cannot raise the hard cap
+                resource.setrlimit(res, (soft, hard))
+            except (OSError, ValueError):
+                pass
+    return apply
+
+def _kill(proc: subprocess.Popen):
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)  # the whole group: shells spawn children
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _pump(pipe, stream: str, buf: OutputBuffer, on_output):
+    dec = codecs.getincrementaldecoder("utf-8")("replace")
+    try:
+        for chunk in iter(lambda: pipe.read1(65536), b""):
+            text = dec.decode(chunk)
+            if text:
+                buf.append(text)
+                if on_output:
+                    on_output(stream, text)
+        text = dec.decode(b"", final=True)
+        if text:
+            buf.append(text)
+    finally:
+        pipe.close()
+
+def run(cmd: list, cwd: Path, key=None, on_output=None, env: dict | None = None, wall_s: int | None = None,
+        cpu_s: int | None = None, mem_mb: int | None = None, max_output_kb: int | None = None) -> dict:
+    """Run `cmd` to completion under the configured limits; never raises for the child's failure.
+
+    Returns {code, status, output, bytes, truncated, wall_ms}; status is exited, timeout,
+    cpu_limit or cancelled. `on_output(stream, text)` sees stdout/stderr as it arrives.
+    """
+    s = get_settings()
+    wall_s = wall_s or s.proc_timeout_s
+    buf = OutputBuffer((max_output_kb or s.proc_output_kb) * 1024)
+    with _slots:
+        t0 = time.perf_counter()
+        try:
+            proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, start_new_session=os.name == "posix",
+                                    preexec_fn=_limiter(cpu_s if cpu_s is not None else s.proc_cpu_s,
+                                                        mem_mb if mem_mb is not None else s.proc_mem_mb))
+        except (OSError, subprocess.SubprocessError) as e:
+            return {"code": None, "status": "failed", "output": str(e), "bytes": 0, "truncated": False, "wall_ms": 0.0}
+        proc.cancelled = False
+        if key is not None:
+            with _running_lock:
+                _running[key] = proc
+        pumps = [threading.Thread(target=_pump, args=(pipe, name, buf, on_output), daemon=True)
+                 for pipe, name in ((proc.stdout, "stdout"), (proc.stderr, "stderr"))]
+        for t in pumps:
+            t.start()
+        status = "exited"
+        try:
+            proc.wait(timeout=wall_s)
+        except subprocess.TimeoutExpired:
+            status = "timeout"
+            _kill(proc)
+            proc.wait()
+        finally:
+            if key is not None:
+                with _running_lock:
+                    _running.pop(key, None)
+        for t in pumps:
+            t.join(timeout=5)
+    if proc.cancelled:
+        status = "cancelled"
+    elif status == "exited" and proc.returncode == -getattr(signal, "SIGXCPU", 0):
+        status = "cpu_limit"
+    return {"code": proc.returncode, "status": status, "output": buf.text(), "bytes": buf.total,
+            "truncated": buf.truncated, "wall_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+def cancel(key) -> bool:
+    """Kill the running process registered under `key`; False if there is none."""
+    with _running_lock:
+        proc = _running.get(key)
+    if proc is None:
+        return False
+    proc.cancelled = True
+    _kill(proc)
+    return True
@@ -0,0 +1,55 @@
+from datetime import datetime
+from markupsafe import Markup, escape
+from sqlalchemy import and_, or_, text
+from lilith.db import Project, session_scope
+import re
+
+# The project list, newest first by (created_at, id) keyset, and full-text search over the
+# project_fts table (migration 0005) that triggers keep in step with projects, steps and events.
+
+MAX_PAGE = 200
+# bm25 column weights: title, goal, step titles, event kinds
+WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+_OPEN, _CLOSE = "\x02", "\x03"  # highlight markers, swapped for <mark> after escaping
+
+def cursor(p: Project) -> str:
+    return f"{p.created_at.isoformat()}|{p.id}"
+
+def page(before: str | None = None, limit: int = 50) -> tuple[list, str | None]:
+    """Projects older than the `before` cursor, and the next cursor (or None); ValueError on a bad cursor."""
+    limit = max(1, min(limit, MAX_PAGE))
+    with session_scope() as s:
+        q = s.query(Project)
+        if before:
+            ts, _, pid = before.rpartition("|")
+            ts, pid = datetime.fromisoformat(ts), int(pid)
+            q = q.filter(or_(Project.created_at < ts, and_(Project.created_at == ts, Project.id < pid)))
+        rows = q.order_by(Project.created_at.desc(), Project.id.desc()).limit(limit + 1).all()
+    return rows[:limit], cursor(rows[limit - 1]) if len(rows) > limit else None
+
+def fts_query(q: str) -> str | None:
+    """User text -> FTS5 query: every word must match, as a prefix. Operators are not exposed."""
+    words = re.findall(r"\w+", q)
+    return " ".join(f'"{w}"*' for w in words[:16]) or None
+
+def _marked(s: str | None) -> Markup:
+    return Markup(str(escape(s or "")).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>"))
+
+def search(q: str, limit: int = 20) -> list[dict]:
+    """Ranked matches: [{id, title, goal, created_at, rank, title_html, snippet_html}]."""
+    match = fts_query(q)
+    if not match:
+        return []
+    limit = max(1, min(limit, MAX_PAGE))
+    sql = text(f"""
+        SELECT p.id, p.title, p.goal, p.created_at, bm25(project_fts, {", ".join(map(str, WEIGHTS))}) AS rank,
+               highlight(project_fts, 0, :o, :c) AS title_hl,
+               snippet(project_fts, -1, :o, :c, '…', 12) AS snip
+        FROM project_fts JOIN projects p ON p.id = project_fts.rowid
+        WHERE project_fts MATCH :match
+        ORDER BY rank LIMIT :limit
+    """)
+    with session_scope() as s:
+        rows = s.execute(sql, {"match": match, "o": _OPEN, "c": _CLOSE, "limit": limit}).all()
+    return [{"id": r.id, "title": r.title, "goal": r.goal, "created_at": r.created_at, "rank": r.rank,
+             "title_html": _marked(r.title_hl), "snippet_html": _marked(r.snip)} for r in rows]
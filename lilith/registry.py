@@ -1,80 +1,215 @@
 ﻿from pathlib import Path
-from lilith.utils import safe_join, file_hash, make_diff
+from lilith.utils import safe_join, file_hash, atomic_write_text, atomic_write_bytes, atomic_rewrite_text
+from lilith.diffing import diff_bytes, is_binary, BINARY_SNIFF
+from lilith.multireplace import Replacer, glob_regex, glob_root
+from lilith.snapshots import walk_files
+from lilith.config import get_settings
+from lilith.overlay import OverlayFS
+from lilith import bus, procs
+from lilith.payloads import is_ref
 from dataclasses import dataclass, field
+from functools import cached_property
+import hashlib, re, shlex, sys, time
 
 class ToolError(Exception): pass
 
+class ArgsError(ToolError):
+    """Arguments rejected by a tool's schema; `errors` is [{"field", "error"}]."""
+
+    def __init__(self, tool: str, errors: list[dict]):
+        self.errors = errors
+        super().__init__(f"Invalid arguments for {tool}: " + "; ".join(f"{e['field']}: {e['error']}" for e in errors))
+
+# args_schema types; "a|b" accepts either, a trailing "!" marks the field required.
+# "path" is a workspace-relative path.
+_ARG_TYPES = {"str": str, "path": str, "list": list, "list[str]": list, "dict": dict, "int": int, "bool": bool}
+MAX_PATH_CHARS = 1024
+MAX_LIST_ITEMS = 10000
+
+def _arg_error(kind: str, v, workspace: Path, max_chars: int) -> str | None:
+    if kind == "str" and is_ref(v):
+        # offloaded string (lilith.payloads): checked by its stored size without loading it
+        return f"longer than {max_chars} characters" if v.get("size", 0) > max_chars else None
+    if not isinstance(v, _ARG_TYPES[kind]) or (kind == "int" and isinstance(v, bool)):
+        return f"expected {kind}"
+    if kind == "str" and len(v) > max_chars:
+        return f"longer than {max_chars} characters"
+    if kind == "path":
+        if len(v) > MAX_PATH_CHARS or "\0" in v:
+            return "not a valid path"
+        try:
+            safe_join(workspace, v)
+        except ValueError:
+            return "path escapes the workspace"
+    if kind.startswith("list"):
+        if len(v) > MAX_LIST_ITEMS:
+            return f"more than {MAX_LIST_ITEMS} items"
+        if kind == "list[str]" and not all((isinstance(x, str) and len(x) <= max_chars) or is_ref(x) for x in v):
+            return "expected a list of strings"
+    return None
+
+def compile_args_schema(schema: dict, max_chars: int):
+    """Build a validator(workspace, args) -> [errors] for one schema. Only the declared fields
+    are looked at (absent or None means the tool default, or "required" for a "!" field);
+    content is never scanned."""
+    fields = []
+    for name, spec in schema.items():
+        required = spec.endswith("!")
+        kinds = spec.removesuffix("!").split("|")
+        unknown = [k for k in kinds if k not in _ARG_TYPES]
+        if unknown:
+            raise ValueError(f"Unknown type {unknown[0]!r} for argument {name!r}")
+        fields.append((name, kinds, required))
+
+    def validate(workspace: Path, args) -> list[dict]:
+        if not isinstance(args, dict):
+            return [{"field": "", "error": "arguments must be an object"}]
+        errors = []
+        for name, kinds, required in fields:
+            v = args.get(name)
+            if v is None:
+                if required:
+                    errors.append({"field": name, "error": "required"})
+                continue
+            problems = [_arg_error(k, v, workspace, max_chars) for k in kinds]
+            if all(problems):
+                errors.append({"field": name, "error": next((p for p in problems if not p.startswith("expected")),
+                                                            f"expected {' or '.join(kinds)}")})
+        return errors
+    return validate
+
 @dataclass
 class ToolManifest:
     name: str
     args_schema: dict
     side_effects: dict  # {"fs": True, "net": False, "env": False}
     requires: list = field(default_factory=list)
+    # external processes may modify files in place; see executor.apply_tool
+    writes_in_place = False
+
+    @cached_property
+    def _validator(self):
+        return compile_args_schema(self.args_schema, get_settings().arg_max_kb * 1024)
+
+    def validate(self, workspace: Path, args: dict):
+        """Check args against args_schema (types, sizes, paths inside `workspace`); raises ArgsError.
+        Offloaded strings pass as strings of their recorded size, so stored args need no hydrate()."""
+        errors = self._validator(workspace, args)
+        if errors:
+            raise ArgsError(self.name, errors)
+
+    def reads(self, args: dict) -> list | None:
+        """Workspace paths dry_run() reads, for preview caching; None = not cacheable."""
+        return None
+
+    def touches(self, args: dict) -> list | None:
+        """Workspace paths apply() reads or writes, for plan scheduling; None = unknown (runs alone)."""
+        return self.reads(args)
+
+    def simulate(self, fs, args: dict):
+        """Make this tool's file changes in an OverlayFS instead of on disk (plan-level Mirror)."""
+        raise NotImplementedError
 
     def dry_run(self, workspace: Path, args: dict):
         raise NotImplementedError
 
-    def apply(self, workspace: Path, args: dict):
+    def apply(self, workspace: Path, args: dict, journal=None):
         raise NotImplementedError
 
 def _ensure_parent(p: Path):
     p.parent.mkdir(parents=True, exist_ok=True)
 
+def _write_file(target: Path, rel, data: bytes, journal=None) -> dict:
+    """Write `data` atomically unless `target` already holds exactly it; returns the file artifact."""
+    digest = hashlib.sha256(data).hexdigest()
+    if target.is_file() and target.stat().st_size == len(data) and file_hash(target) == digest:
+        return {"type":"file","path": str(rel), "hash": digest, "unchanged": True}
+    _record(journal, target)
+    _ensure_parent(target)
+    atomic_write_bytes(target, data)
+    return {"type":"file","path": str(rel), "hash": digest}
+
+def _preview(before: bytes | None, after: bytes | None, rel) -> str:
+    s = get_settings()
+    return diff_bytes(before, after, str(rel), max_bytes=s.diff_max_kb * 1024,
+                      max_file_bytes=s.diff_max_file_mb * 1024 * 1024)
+
+def preview_changes(fs: OverlayFS) -> dict:
+    touched = fs.touched()
+    diff = "".join(_preview(before, after, rel) for rel, before, after in touched)
+    return {"preview_diff": diff, "files":[{"path": rel, "exists_before": before is not None} for rel, before, _ in touched]}
+
+def _simulated_preview(tool: "ToolManifest", workspace: Path, args: dict) -> dict:
+    fs = OverlayFS(workspace)
+    tool.simulate(fs, args)
+    return preview_changes(fs)
+
+def _record(journal, target: Path):
+    # remember the prior content of `target` so this apply can be undone
+    if journal is not None:
+        journal.record(target)
+
 class WriteFileTool(ToolManifest):
+    def reads(self, args: dict):
+        return [args.get("path")]
+
+    def simulate(self, fs: OverlayFS, args: dict):
+        fs.write_text(args.get("path"), args.get("content",""))
+
     def dry_run(self, workspace: Path, args: dict):
-        rel = args.get("path")
-        content = args.get("content","")
-        target = safe_join(workspace, rel)
-        before = target.read_text(encoding="utf-8") if target.exists() else ""
-        diff = make_diff(before, content, rel)
-        return {"preview_diff": diff, "files":[{"path": str(rel), "exists_before": target.exists()}]}
+        return _simulated_preview(self, workspace, args)
 
-    def apply(self, workspace: Path, args: dict):
+    def apply(self, workspace: Path, args: dict, journal=None):
         rel = args.get("path")
         content = args.get("content","")
         target = safe_join(workspace, rel)
-        _ensure_parent(target)
-        target.write_text(content, encoding="utf-8")
-        return {"artifacts":[{"type":"file","path": str(rel), "hash": file_hash(target)}]}
+        return {"artifacts":[_write_file(target, rel, content.encode("utf-8"), journal)]}
 
 class ReplaceTextTool(ToolManifest):
-    def dry_run(self, workspace: Path, args: dict):
+    def reads(self, args: dict):
+        return [args.get("path")]
+
+    def simulate(self, fs: OverlayFS, args: dict):
         rel = args.get("path"); search=args.get("search",""); repl=args.get("replace","")
-        target = safe_join(workspace, rel)
-        if not target.exists():
+        raw = fs.read_bytes(rel)
+        if raw is None:
             raise ToolError(f"File not found: {rel}")
-        before = target.read_text(encoding="utf-8")
-        after = before.replace(search, repl)
-        diff = make_diff(before, after, rel)
-        return {"preview_diff": diff, "files":[{"path": str(rel), "exists_before": True}]}
+        try:
+            before = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            raise ToolError(f"Not a UTF-8 text file: {rel}")
+        fs.write_text(rel, before.replace(search, repl))
+
+    def dry_run(self, workspace: Path, args: dict):
+        return _simulated_preview(self, workspace, args)
 
-    def apply(self, workspace: Path, args: dict):
+    def apply(self, workspace: Path, args: dict, journal=None):
         rel = args.get("path"); search=args.get("search",""); repl=args.get("replace","")
         target = safe_join(workspace, rel)
         if not target.exists():
             raise ToolError(f"File not found: {rel}")
-        before = target.read_text(encoding="utf-8")
+        try:
+            before = target.read_bytes().decode("utf-8")  # bytes: keep the file's own newlines
+        except UnicodeDecodeError:
+            raise ToolError(f"Not a UTF-8 text file: {rel}")
         after = before.replace(search, repl)
-        target.write_text(after, encoding="utf-8")
-        return {"artifacts":[{"type":"file","path": str(rel), "hash": file_hash(target)}]}
+        return {"artifacts":[_write_file(target, rel, after.encode("utf-8"), journal)]}
 
 class ScaffoldSiteTool(ToolManifest):
+    def reads(self, args: dict):
+        return [(Path(args.get("dir","site")) / "index.html").as_posix()]
+
+    def simulate(self, fs: OverlayFS, args: dict):
+        fs.write_text(Path(args.get("dir","site")) / "index.html", _tailwind_index())
+
     def dry_run(self, workspace: Path, args: dict):
-        rel_dir = args.get("dir","site")
-        index_rel = Path(rel_dir) / "index.html"
-        index_path = safe_join(workspace, index_rel)
-        before = index_path.read_text(encoding="utf-8") if index_path.exists() else ""
-        after = _tailwind_index()
-        diff = make_diff(before, after, str(index_rel))
-        return {"preview_diff": diff, "files":[{"path": str(index_rel), "exists_before": index_path.exists()}]}
+        return _simulated_preview(self, workspace, args)
 
-    def apply(self, workspace: Path, args: dict):
+    def apply(self, workspace: Path, args: dict, journal=None):
         rel_dir = args.get("dir","site")
         index_rel = Path(rel_dir) / "index.html"
         index_path = safe_join(workspace, index_rel)
-        index_path.parent.mkdir(parents=True, exist_ok=True)
-        index_path.write_text(_tailwind_index(), encoding="utf-8")
-        return {"artifacts":[{"type":"file","path": str(index_rel), "hash": file_hash(index_path)}]}
+        return {"artifacts":[_write_file(index_path, index_rel, _tailwind_index().encode("utf-8"), journal)]}
 
 def _tailwind_index():
     return """<!doctype html>
@@ -94,34 +229,177 @@ def _tailwind_index():
   </body>
 </html>
 """
+def _replacement_error(r) -> str | None:
+    # one bulk_replace item: {"search": str, "replace": str (default ""), "regex": bool (default false)}
+    if not isinstance(r, dict):
+        return "expected an object with search and replace"
+    for key, required in (("search", True), ("replace", False)):
+        v = r.get(key)
+        if (v is not None or required) and not (isinstance(v, str) or is_ref(v)):
+            return f"{key} must be a string"
+    if not isinstance(r.get("regex", False), bool):
+        return "regex must be true or false"
+    return None
+
+class BulkReplaceTool(ToolManifest):
+    """Literal/regex replacements across every text file matching a glob, one pass per file."""
+
+    def validate(self, workspace: Path, args: dict):
+        super().validate(workspace, args)
+        errors = [{"field": f"replacements[{i}]", "error": e}
+                  for i, r in enumerate(args.get("replacements") or []) if (e := _replacement_error(r))]
+        if errors:
+            raise ArgsError(self.name, errors)
+
+    def _compile(self, args: dict):
+        try:
+            return Replacer(args.get("replacements") or []), glob_regex(args.get("glob") or "**/*")
+        except (ValueError, re.error) as e:
+            raise ToolError(f"Bad replacements: {e}")
+
+    def touches(self, args: dict):
+        root = glob_root(args.get("glob") or "**/*")  # same default as _compile
+        return None if root is None else [root]
+
+    def simulate(self, fs: OverlayFS, args: dict):
+        replacer, rx = self._compile(args)
+        for rel in fs.glob(rx):
+            raw = fs.read_bytes(rel)
+            if is_binary(raw):
+                continue
+            before = raw.decode("utf-8")
+            after, n = replacer.text(before)
+            if n and after != before:
+                fs.write_text(rel, after)
+
+    def dry_run(self, workspace: Path, args: dict):
+        return _simulated_preview(self, workspace, args)
+
+    def apply(self, workspace: Path, args: dict, journal=None):
+        replacer, rx = self._compile(args)
+        out = {"artifacts": [], "files_scanned": 0, "skipped_binary": 0, "replacements": 0}
+        for rel, p, st in walk_files(workspace.resolve()):
+            if not rx.match(rel):
+                continue
+            out["files_scanned"] += 1
+            with open(p, "rb") as f:
+                if b"\0" in f.read(BINARY_SNIFF):
+                    out["skipped_binary"] += 1
+                    continue
+            counted = []
+            def fill(src, dst):
+                n, changed = replacer.stream(src, dst)
+                counted.append(n)
+                return changed
+            try:
+                # only files whose content actually changes are journaled and replaced
+                if atomic_rewrite_text(p, fill, before_replace=lambda: _record(journal, p)):
+                    out["replacements"] += counted[0]
+                    out["artifacts"].append({"type":"file","path": rel, "hash": file_hash(p)})
+            except UnicodeDecodeError:
+                out["skipped_binary"] += 1
+        out["files_changed"] = len(out["artifacts"])
+        return out
+
 class ShellEchoTool(ToolManifest):
+    def reads(self, args: dict):
+        return []
+
     def dry_run(self, workspace: Path, args: dict):
         text = args.get("text","")
         preview = f"$ echo {text!r}\n{text}\n"
         return {"preview_log": preview}
 
-    def apply(self, workspace: Path, args: dict):
+    def apply(self, workspace: Path, args: dict, journal=None):
         text = args.get("text","")
         # We only allow echo for safety in MVP
         return {"artifacts":[{"type":"log","path":"echo.log","hash":""}],"stdout": text}
 
+def _command(args: dict) -> list:
+    cmd = args.get("cmd") or []
+    cmd = shlex.split(cmd) if isinstance(cmd, str) else [str(c) for c in cmd]
+    if not cmd:
+        raise ToolError("Empty command")
+    return cmd
+
+def _run_logged(name: str, workspace: Path, cmd: list, cwd: Path, journal=None) -> dict:
+    """Run through procs with live output; the (tail of the) output is kept as a log artifact."""
+    ctx = bus.current_step.get()
+    # bound here: the output pumps run on their own threads, outside this context
+    on_output = (lambda stream, text: bus.output(ctx[0], ctx[1], stream, text)) if ctx else None
+    res = procs.run(cmd, cwd, key=ctx[1] if ctx else None, on_output=on_output)
+    log_rel = f".lilith/logs/{name}-{time.time_ns()}.log"
+    log = safe_join(workspace, log_rel)
+    _record(journal, log)
+    _ensure_parent(log)
+    atomic_write_text(log, f"$ {shlex.join(cmd)}\n{res['output']}\n[{res['status']}, exit {res['code']}, {res['wall_ms']} ms]\n")
+    artifact = {"type":"log","path": log_rel, "hash": file_hash(log)}
+    if res["status"] != "exited" or res["code"] != 0:
+        tail = res["output"][-2000:]
+        raise ToolError(f"{shlex.join(cmd)}: {res['status']} (exit {res['code']}), log in {log_rel}\n{tail}")
+    return {"artifacts":[artifact], "code": res["code"], "wall_ms": res["wall_ms"],
+            "output_bytes": res["bytes"], "truncated": res["truncated"]}
+
+class RunCommandTool(ToolManifest):
+    writes_in_place = True
+
+    def reads(self, args: dict):
+        return []
+
+    def touches(self, args: dict):
+        return None  # a command can touch anything
+
+    def dry_run(self, workspace: Path, args: dict):
+        cmd = _command(args)
+        return {"preview_log": f"$ {shlex.join(cmd)}  (in {args.get('cwd') or '.'})\nNot run in the Mirror.\n"}
+
+    def apply(self, workspace: Path, args: dict, journal=None):
+        cwd = safe_join(workspace, args.get("cwd") or ".")
+        return _run_logged(self.name, workspace, _command(args), cwd, journal)
+
+class PipInstallTool(ToolManifest):
+    writes_in_place = True
+
+    def _pip(self, workspace: Path) -> Path:
+        return workspace / (".venv/Scripts/pip.exe" if sys.platform.startswith("win") else ".venv/bin/pip")
+
+    def reads(self, args: dict):
+        return []
+
+    def touches(self, args: dict):
+        return [".venv", "requirements.txt"]
+
+    def dry_run(self, workspace: Path, args: dict):
+        pip_args = args.get("args") or ["-r", "requirements.txt"]
+        return {"preview_log": f"$ {shlex.join(['pip', 'install', *pip_args])}  (workspace .venv)\nNot run in the Mirror.\n"}
+
+    def apply(self, workspace: Path, args: dict, journal=None):
+        pip = self._pip(workspace)
+        if not pip.exists():
+            raise ToolError("No virtualenv at .venv in the workspace")
+        cmd = [str(pip), "install", *(args.get("args") or ["-r", "requirements.txt"])]
+        return _run_logged(self.name, workspace, cmd, workspace, journal)
+
 TOOL_REGISTRY = {
-    "write_file": WriteFileTool(name="write_file", args_schema={"path":"str","content":"str"},
+    "write_file": WriteFileTool(name="write_file", args_schema={"path":"path!","content":"str"},
                                 side_effects={"fs": True,"net": False,"env": False}),
-    "replace_text": ReplaceTextTool(name="replace_text", args_schema={"path":"str","search":"str","replace":"str"},
+    "replace_text": ReplaceTextTool(name="replace_text", args_schema={"path":"path!","search":"str","replace":"str"},
                                     side_effects={"fs": True,"net": False,"env": False}),
-    "scaffold_site": ScaffoldSiteTool(name="scaffold_site", args_schema={"dir":"str"},
+    "scaffold_site": ScaffoldSiteTool(name="scaffold_site", args_schema={"dir":"path"},
                                       side_effects={"fs": True,"net": False,"env": False}),
+    "bulk_replace": BulkReplaceTool(name="bulk_replace", args_schema={"glob":"str","replacements":"list"},
+                                    side_effects={"fs": True,"net": False,"env": False}),
     "shell_echo": ShellEchoTool(name="shell_echo", args_schema={"text":"str"},
                                 side_effects={"fs": False,"net": False,"env": False}),
+    "run_command": RunCommandTool(name="run_command", args_schema={"cmd":"str|list[str]","cwd":"path"},
+                                  side_effects={"fs": True,"net": False,"env": True}),
+    "pip_install": PipInstallTool(name="pip_install", args_schema={"args":"list[str]"},
+                                  side_effects={"fs": True,"net": True,"env": True}),
 }
 
 
 # --- Lilith Fix Pack: basic file/process tools ---
 from pathlib import Path as _LF_Path
-import subprocess as _LF_subprocess, sys as _LF_sys
-
-class ToolError(Exception): pass
 
 def write_text(path: str, content: str):
     p = _LF_Path(path); p.parent.mkdir(parents=True, exist_ok=True)
@@ -146,18 +424,7 @@ def ensure_requirements(packages: list[str]):
     p.write_text("\n".join(merged) + "\n", encoding="utf-8")
     return {"requirements": merged}
 
-def pip_install(args: list[str] = None):
-    args = args or ["-r", "requirements.txt"]
-    pip = _LF_Path(".venv/Scripts/pip.exe") if _LF_sys.platform.startswith("win") else _LF_Path(".venv/bin/pip")
-    cmd = [str(pip), "install", *args]
-    proc = _LF_subprocess.run(cmd, capture_output=True, text=True)
-    if proc.returncode != 0:
-        raise ToolError(proc.stderr)
-    return {"stdout": proc.stdout}
-
-def run_command(cmd: list[str], cwd: str = "."):
-    proc = _LF_subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
-    return {"code": proc.returncode, "stdout": proc.stdout, "stderr": proc.stderr}
+# run_command and pip_install are manifest tools above (managed by lilith.procs)
 
 try:
     TOOL_REGISTRY  # may already exist
@@ -168,7 +435,5 @@ TOOL_REGISTRY.update({
     "write_text": write_text,
     "append_text": append_text,
     "ensure_requirements": ensure_requirements,
-    "pip_install": pip_install,
-    "run_command": run_command,
 })
 # --- end Fix Pack block ---
@@ -0,0 +1,185 @@
+from pathlib import Path
+from dataclasses import dataclass
+from contextlib import contextmanager
+from collections import Counter
+from lilith.db import Checkpoint, Event, Job, session_scope
+from lilith.blobs import BlobStore
+from lilith.snapshots import load_manifest, walk_files
+from lilith.background import start_periodic
+from lilith import payloads
+from lilith.eventsink import SINK
+import shutil, threading, time
+
+@dataclass
+class RetentionPolicy:
+    keep_last: int = 10
+    keep_hourly: int = 24   # newest checkpoint in each of the last N hours that have one
+    keep_daily: int = 7     # newest checkpoint in each of the last N days that have one
+    max_bytes: int = 0      # per-project budget; 0 = unlimited
+    grace_s: int = 3600     # never touch blobs/orphans younger than this
+
+    @classmethod
+    def from_settings(cls, settings) -> "RetentionPolicy":
+        return cls(keep_last=settings.keep_last, keep_hourly=settings.keep_hourly,
+                   keep_daily=settings.keep_daily, max_bytes=settings.checkpoint_budget_mb * 1024 * 1024)
+
+# Checkpoints an in-flight rollback/restore is reading; the sweeper never deletes these.
+_pins = Counter()
+_pins_lock = threading.Lock()
+
+def pin(path):
+    with _pins_lock:
+        _pins[str(path)] += 1
+
+def unpin(path):
+    key = str(path)
+    with _pins_lock:
+        _pins[key] -= 1
+        if _pins[key] <= 0:
+            del _pins[key]
+
+@contextmanager
+def pinned(path):
+    pin(path)
+    try:
+        yield
+    finally:
+        unpin(path)
+
+def is_pinned(path) -> bool:
+    with _pins_lock:
+        return str(path) in _pins
+
+def _cost(path: Path, seen: set) -> tuple[int, set]:
+    """Bytes this checkpoint adds on top of already-counted (newer) ones, plus the keys it owns."""
+    if not path.exists():
+        return 0, set()
+    if path.suffix == ".json":
+        sizes = {e["sha256"]: e["size"] for e in load_manifest(path)["files"].values()}
+        new = set(sizes) - seen
+        return path.stat().st_size + sum(sizes[k] for k in new), new
+    if path.is_dir():
+        total, new = 0, set()
+        for rel, p, st in walk_files(path):
+            key = (st.st_dev, st.st_ino)
+            if key not in seen and key not in new:
+                new.add(key)
+                total += st.st_size
+        return total, new
+    return path.stat().st_size, set()
+
+def plan_retention(cps: list, policy: RetentionPolicy, protected: set) -> list:
+    """Return the checkpoints to delete. `cps` must be newest first; `protected` ids are always kept."""
+    keep = {c.id for c in cps[:policy.keep_last]} | protected
+    for fmt, n in (("%Y%m%d%H", policy.keep_hourly), ("%Y%m%d", policy.keep_daily)):
+        buckets = set()
+        for c in cps:
+            b = c.ts.strftime(fmt)
+            if b in buckets:
+                continue
+            if len(buckets) >= n:
+                break
+            buckets.add(b)
+            keep.add(c.id)
+    if policy.max_bytes:
+        used, seen = 0, set()
+        for c in cps:
+            if c.id not in keep:
+                continue
+            cost, keys = _cost(Path(c.zip_path), seen)
+            if c.id not in protected and used + cost > policy.max_bytes:
+                keep.discard(c.id)
+                continue
+            used += cost
+            seen |= keys
+    return [c for c in cps if c.id not in keep]
+
+def _disk_bytes(path: Path) -> int:
+    # bytes actually freed by deleting `path` (hardlinked tree files are freed only with their last link)
+    if not path.exists():
+        return 0
+    if path.is_dir():
+        return sum(st.st_size for _, _, st in walk_files(path) if st.st_nlink == 1)
+    return path.stat().st_size
+
+def _remove(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+def _awaited(project_id: int) -> set:
+    # checkpoints that queued or running restore jobs will read; pins only cover a restore in progress
+    with session_scope() as s:
+        rows = s.query(Job.args_json).filter(Job.project_id==project_id, Job.kind=="restore",
+                                             Job.status.in_(("queued", "running")))
+        return {(args or {}).get("checkpoint_id") for (args,) in rows}
+
+def prune_project(project_id: int, policy: RetentionPolicy) -> dict | None:
+    with session_scope() as s:
+        cps = s.query(Checkpoint).filter(Checkpoint.project_id==project_id).order_by(Checkpoint.id.desc()).all()
+    if not cps:
+        return None
+    # the newest checkpoint is what rollback_last restores
+    awaited = _awaited(project_id)
+    protected = {cps[0].id} | {c.id for c in cps if c.id in awaited or is_pinned(c.zip_path)}
+    doomed = plan_retention(cps, policy, protected)
+    if not doomed:
+        return None
+    reclaimed = sum(_disk_bytes(Path(c.zip_path)) for c in doomed)
+    summary = {"deleted": [c.id for c in doomed], "kept": len(cps) - len(doomed), "bytes": reclaimed}
+    with session_scope() as s:
+        s.query(Checkpoint).filter(Checkpoint.id.in_(summary["deleted"])).delete(synchronize_session=False)
+        s.add(Event(project_id=project_id, kind="checkpoints_pruned", payload_json=summary))
+    # rows go first: a crash here leaves orphan files, which the next sweep removes
+    for c in doomed:
+        _remove(Path(c.zip_path))
+    return summary
+
+def _live_digests(checkpoints_root: Path) -> set:
+    live = set()
+    for m in checkpoints_root.glob("*/*.json"):
+        live.update(e["sha256"] for e in load_manifest(m)["files"].values())
+    with session_scope() as s:
+        for (payload,) in s.query(Event.payload_json).filter(Event.kind=="applied"):
+            live.update(u["blob"] for u in (payload or {}).get("undo", []) if u.get("blob"))
+    return live
+
+def collect_garbage(checkpoints_root: Path, store: BlobStore, grace_s: int) -> dict:
+    """Delete unreferenced blobs and orphaned checkpoint files older than `grace_s`."""
+    cutoff = time.time() - grace_s
+    blobs = orphans = freed = 0
+    with store.lock:
+        live = _live_digests(checkpoints_root)
+        for digest, p, st in store.iter_blobs():
+            if digest not in live and st.st_mtime < cutoff:
+                store.delete(digest)
+                blobs += 1
+                freed += st.st_size
+        for p in store.root.glob(".tmp-*"):
+            if p.stat().st_mtime < cutoff:
+                p.unlink(missing_ok=True)
+    with session_scope() as s:
+        known = {path for (path,) in s.query(Checkpoint.zip_path)}
+    for d in checkpoints_root.iterdir() if checkpoints_root.exists() else []:
+        if not d.is_dir() or d == store.root:
+            continue
+        for p in d.iterdir():
+            if str(p) not in known and p.stat().st_mtime < cutoff and not is_pinned(p):
+                freed += _disk_bytes(p)
+                _remove(p)
+                orphans += 1
+    return {"blobs": blobs, "orphans": orphans, "bytes": freed}
+
+def sweep(checkpoints_root: Path, store: BlobStore, policy: RetentionPolicy) -> dict:
+    with session_scope() as s:
+        project_ids = [pid for (pid,) in s.query(Checkpoint.project_id).distinct()]
+    pruned = {pid: r for pid in project_ids if (r := prune_project(pid, policy))}
+    gc = collect_garbage(checkpoints_root, store, policy.grace_s)
+    gc["payloads"] = payloads.collect(policy.grace_s)
+    if gc["blobs"] or gc["orphans"] or gc["payloads"]["blobs"]:
+        SINK.emit(None, "storage_collected", gc)
+    return {"pruned": pruned, "collected": gc}
+
+def start_sweeper(checkpoints_root: Path, store: BlobStore, policy: RetentionPolicy, interval_s: float):
+    return start_periodic("checkpoint-sweeper", interval_s, lambda: sweep(checkpoints_root, store, policy))
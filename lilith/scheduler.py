@@ -0,0 +1,99 @@
+from lilith.db import Step, Event, session_scope
+from lilith.eventsink import SINK
+from lilith.registry import TOOL_REGISTRY
+from lilith.executor import begin_checkpoint, run_step, settle_checkpoint
+from lilith.config import get_settings
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+import posixpath, time
+
+# Plan apply as a DAG: explicit Step.depends_on (step ids) plus an edge from every earlier
+# step whose declared paths overlap. Independent steps run concurrently; a failed step
+# skips everything downstream of it and nothing else.
+
+def _paths(step) -> list | None:
+    tool = TOOL_REGISTRY.get(step.tool)
+    paths = tool.touches(step.args_json or {}) if tool else None
+    return None if paths is None else [posixpath.normpath(str(p)) for p in paths]
+
+def _overlaps(a: list | None, b: list | None) -> bool:
+    if a is None or b is None:
+        return True  # unknown footprint: serialize
+    return any(x == y or x.startswith(y + "/") or y.startswith(x + "/") for x in a for y in b)
+
+def build_graph(steps: list) -> dict:
+    """{step_id: set(step ids it waits for)}, restricted to `steps`."""
+    ids = {s.id for s in steps}
+    ordered = sorted(steps, key=lambda s: (s.order_idx, s.id))
+    paths = {s.id: _paths(s) for s in ordered}
+    deps = {}
+    for i, s in enumerate(ordered):
+        deps[s.id] = {d for d in (s.depends_on or []) if d in ids and d != s.id}
+        deps[s.id] |= {e.id for e in ordered[:i] if _overlaps(paths[e.id], paths[s.id])}
+    return deps
+
+def _skip(project_id: int, step_ids: list, reason: str):
+    with session_scope() as s:
+        for st in s.query(Step).filter(Step.id.in_(step_ids)):
+            st.status = "skipped"
+            s.add(Event(project_id=project_id, step_id=st.id, kind="skipped", payload_json={"reason": reason}))
+
+def run_plan(project_id: int, workspace: Path, workers: int | None = None, on_progress=None) -> dict:
+    """Apply every step that is not done yet behind one checkpoint; returns ids per outcome."""
+    t0 = time.perf_counter()
+    with session_scope() as s:
+        steps = s.query(Step).filter(Step.project_id==project_id, Step.status.notin_(("done", "applied"))).all()
+    summary = {"applied": [], "failed": [], "skipped": []}
+    if not steps:
+        return {**summary, "wall_ms": 0.0}
+    deps = build_graph(steps)
+    dependents = {sid: set() for sid in deps}
+    for sid, ds in deps.items():
+        for d in ds:
+            dependents[d].add(sid)
+    cp = begin_checkpoint(project_id, workspace)
+    try:
+        waiting = {sid: set(ds) for sid, ds in deps.items()}
+        running = {}
+        with ThreadPoolExecutor(max_workers=workers or get_settings().apply_workers, thread_name_prefix="apply") as pool:
+            while waiting or running:
+                for sid in [sid for sid, ds in waiting.items() if not ds]:
+                    del waiting[sid]
+                    timing = {"queued_ms": round((time.perf_counter() - t0) * 1000, 1)}
+                    running[pool.submit(run_step, sid, workspace, timing)] = sid
+                if not running:
+                    # only cycles are left in `waiting`
+                    summary["skipped"] += list(waiting)
+                    _skip(project_id, list(waiting), "dependency cycle")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    sid = running.pop(fut)
+                    try:
+                        fut.result()
+                    except Exception:  # run_step has marked it "error"
+                        summary["failed"].append(sid)
+                        doomed, todo = [], list(dependents[sid])
+                        while todo:
+                            d = todo.pop()
+                            if d in waiting:
+                                del waiting[d]
+                                doomed.append(d)
+                                todo.extend(dependents[d])
+                        if doomed:
+                            summary["skipped"] += doomed
+                            _skip(project_id, doomed, f"step {sid} failed")
+                        continue
+                    summary["applied"].append(sid)
+                    for d in dependents[sid]:
+                        if d in waiting:
+                            waiting[d].discard(sid)
+                if on_progress:
+                    on_progress(done=len(summary["applied"]) + len(summary["failed"]) + len(summary["skipped"]),
+                                total=len(steps))
+    finally:
+        # also when the loop itself dies: applied steps still settle and the run is logged
+        cp.add_done_callback(lambda f: settle_checkpoint(project_id, summary["applied"], f))
+        summary["wall_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        SINK.emit(project_id, "plan_applied", summary)
+    return summary
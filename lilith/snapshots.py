@@ -0,0 +1,329 @@
+from pathlib import Path
+from lilith.blobs import BlobStore
+from lilith.archiver import write_zip
+from lilith.utils import file_hash, safe_join, prune_empty_dirs
+import errno, filecmp, json, os, shutil, tempfile, time, zipfile, zlib
+
+try:
+    import fcntl  # reflinks are Linux-only
+except ImportError:
+    fcntl = None
+
+# Checkpoint manifests map workspace-relative paths to blobs in a BlobStore:
+# {"version": 1, "created_ns": ..., "files": {"a/b.txt": {"sha256", "size", "mtime_ns"}}}
+MANIFEST_VERSION = 1
+
+def walk_files(workspace: Path):
+    for root, dirs, files in os.walk(workspace):
+        for f in files:
+            p = Path(root) / f
+            yield p.relative_to(workspace).as_posix(), p, p.stat()
+
+def load_manifest(path: Path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _unchanged(entry: dict | None, st, since_ns: int) -> bool:
+    # Entries whose mtime is not strictly older than the previous manifest are
+    # "racily clean" (same-tick rewrite) and must be re-hashed.
+    return bool(entry) and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns \
+        and st.st_mtime_ns < since_ns
+
+def _link_or_copy(src: Path, dst: Path):
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def _known_sha(known: dict | None, rel: str, st) -> str | None:
+    # hash from the workspace file index, trusted only while the file's stat still matches
+    k = (known or {}).get(rel)
+    if k and k[0] == st.st_size and k[1] == st.st_mtime_ns and st.st_mtime_ns < k[3]:
+        return k[2]
+    return None
+
+def stage_manifest(workspace: Path, store: BlobStore, previous: dict | None = None,
+                   staging: Path | None = None, known: dict | None = None) -> dict:
+    """Freeze the workspace state without hashing: unchanged files keep their previous blob,
+    changed ones are hardlinked into `staging` (tools replace files, so the link keeps
+    today's bytes). Without `staging`, changed files are read in place by finalize.
+    `known` ({path: (size, mtime_ns, sha256, hashed_ns)}, see fileindex.entries) supplies
+    hashes for changed files so finalize need not re-read them."""
+    prev_files = (previous or {}).get("files", {})
+    since_ns = (previous or {}).get("created_ns", 0)
+    pending = {"created_ns": time.time_ns(), "staging": str(staging) if staging else None, "files": {}}
+    for rel, p, st in walk_files(workspace):
+        old = prev_files.get(rel)
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        sha = _known_sha(known, rel, st)
+        if sha:
+            entry["sha256"] = sha
+        if _unchanged(old, st, since_ns) and store.has(old["sha256"]):
+            entry["sha256"] = old["sha256"]
+        elif sha and store.touch(sha):
+            pass  # content already stored; touching keeps GC off it until finalize
+        elif staging is not None:
+            _link_or_copy(p, staging / rel)
+            entry["src"] = str(staging / rel)
+        else:
+            entry["src"] = str(p)
+        pending["files"][rel] = entry
+    return pending
+
+def finalize_manifest(pending: dict, manifest_path: Path, store: BlobStore) -> dict:
+    """Hash and store staged files, then write the manifest.
+
+    Returns capture stats: files, bytes_in (workspace size), bytes_out (new blob bytes).
+    """
+    stats = {"files": 0, "bytes_in": 0, "bytes_out": 0}
+    files = {}
+    for rel, entry in pending["files"].items():
+        src = entry.pop("src", None)
+        if src is not None:
+            digest = entry.get("sha256") or file_hash(Path(src))
+            if not store.has(digest):
+                store.put_file(Path(src), digest)
+                stats["bytes_out"] += entry["size"]
+            entry["sha256"] = digest
+        files[rel] = entry
+        stats["files"] += 1
+        stats["bytes_in"] += entry["size"]
+    manifest = {"version": MANIFEST_VERSION, "created_ns": pending["created_ns"], "files": files}
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = manifest_path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(tmp, manifest_path)
+    stats["bytes_out"] += manifest_path.stat().st_size
+    if pending["staging"]:
+        shutil.rmtree(pending["staging"], ignore_errors=True)
+    return stats
+
+def write_manifest(workspace: Path, manifest_path: Path, store: BlobStore, previous: dict | None = None,
+                   known: dict | None = None) -> dict:
+    """Snapshot `workspace` into `store`; only files changed since `previous` are read."""
+    return finalize_manifest(stage_manifest(workspace, store, previous, known=known), manifest_path, store)
+
+def _replace_with(dest: Path, fill):
+    # materialize into a sibling temp file, then rename over `dest` (never modify in place)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if dest.is_dir():
+        shutil.rmtree(dest)
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        fill(Path(tmp))
+        os.replace(tmp, dest)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+def unshare_files(workspace: Path, roots: list | None = None) -> int:
+    """Give each file under `roots` (default: all) that shares its inode with a tree snapshot
+    or checkpoint staging a private copy, so an in-place write cannot reach the snapshot.
+    Reflinked files are copy-on-write already and are left alone. Returns the files copied."""
+    targets = [workspace] if roots is None else [safe_join(workspace, r) for r in roots]
+    copied = 0
+    for t in targets:
+        files = [(t, t.stat())] if t.is_file() else [(p, st) for _, p, st in walk_files(t)] if t.is_dir() else []
+        for p, st in files:
+            if st.st_nlink > 1:
+                _replace_with(p, lambda tmp, src=p: shutil.copy2(src, tmp))
+                copied += 1
+    return copied
+
+def restore_minimal(reader, workspace: Path) -> dict:
+    """Make `workspace` match a checkpoint, touching only files that differ.
+
+    `reader` exposes `entries` (rel -> meta), `same(rel, path, stat)` and `write(rel, dest)`.
+    """
+    t0 = time.perf_counter()
+    workspace.mkdir(parents=True, exist_ok=True)
+    stats = {"written": 0, "deleted": 0, "unchanged": 0}
+    ok = set()
+    for rel, p, st in list(walk_files(workspace)):
+        if rel not in reader.entries:
+            p.unlink()
+            prune_empty_dirs(p.parent, workspace)
+            stats["deleted"] += 1
+        elif reader.same(rel, p, st):
+            ok.add(rel)
+            stats["unchanged"] += 1
+    for rel in reader.entries:
+        if rel not in ok:
+            reader.write(rel, safe_join(workspace, rel))
+            stats["written"] += 1
+    stats["wall_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return stats
+
+class _ManifestReader:
+    def __init__(self, path: Path, store: BlobStore, known: dict | None = None):
+        self.entries = load_manifest(path)["files"]
+        self.store = store
+        self.known = known
+
+    def same(self, rel, p, st):
+        e = self.entries[rel]
+        if e["size"] != st.st_size:
+            return False
+        # the file index has the hash of every file whose stat is unchanged; only the rest are read
+        return (_known_sha(self.known, rel, st) or file_hash(p)) == e["sha256"]
+
+    def write(self, rel, dest):
+        self.store.copy_to(self.entries[rel]["sha256"], dest)
+
+class _ZipReader:
+    def __init__(self, zf: zipfile.ZipFile):
+        self.zf = zf
+        self.entries = {i.filename: i for i in zf.infolist() if not i.is_dir()}
+
+    def same(self, rel, p, st):
+        info = self.entries[rel]
+        if info.file_size != st.st_size:
+            return False
+        crc = 0
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                crc = zlib.crc32(chunk, crc)
+        return crc == info.CRC
+
+    def write(self, rel, dest):
+        def fill(tmp):
+            with self.zf.open(self.entries[rel]) as src, open(tmp, "wb") as out:
+                shutil.copyfileobj(src, out)
+        _replace_with(dest, fill)
+
+class _TreeReader:
+    def __init__(self, path: Path, clone):
+        self.root = path
+        self.clone = clone
+        self.entries = {rel: st for rel, p, st in walk_files(path)}
+
+    def same(self, rel, p, st):
+        snap = self.entries[rel]
+        if (snap.st_dev, snap.st_ino) == (st.st_dev, st.st_ino):
+            return True
+        return snap.st_size == st.st_size and filecmp.cmp(self.root / rel, p, shallow=False)
+
+    def write(self, rel, dest):
+        def fill(tmp):
+            tmp.unlink()
+            self.clone(self.root / rel, tmp)
+        _replace_with(dest, fill)
+
+class ManifestBackend:
+    """Deduplicated blob manifests (portable default)."""
+    suffix = ".json"
+
+    def __init__(self, store: BlobStore):
+        self.store = store
+
+    def _previous(self, previous: Path | None):
+        return load_manifest(previous) if previous and previous.suffix == self.suffix and previous.exists() else None
+
+    def capture(self, workspace: Path, dest: Path, previous: Path | None = None, known: dict | None = None) -> dict:
+        # unchanged files reuse blobs without re-putting them: keep GC out until the manifest exists
+        with self.store.lock:
+            return write_manifest(workspace, dest, self.store, previous=self._previous(previous), known=known)
+
+    # Two-phase capture for asynchronous checkpoints: stage() is cheap and runs before the
+    # tool touches the workspace; finalize() does the hashing/copying on a background worker.
+    # The caller must keep `previous` from being pruned until finalize() returns.
+    def stage(self, workspace: Path, dest: Path, previous: Path | None = None, known: dict | None = None) -> dict:
+        return stage_manifest(workspace, self.store, self._previous(previous), staging=dest.with_suffix(".staging"),
+                              known=known)
+
+    def finalize(self, pending: dict, dest: Path) -> dict:
+        with self.store.lock:
+            return finalize_manifest(pending, dest, self.store)
+
+    def restore(self, path: Path, workspace: Path, known: dict | None = None) -> dict:
+        return restore_minimal(_ManifestReader(path, self.store, known), workspace)
+
+class ZipBackend:
+    """Full-workspace zip archives, self-contained and readable anywhere."""
+    suffix = ".zip"
+
+    def __init__(self, level: int = 6, workers: int = 4):
+        self.level = level
+        self.workers = workers
+
+    def capture(self, workspace: Path, dest: Path, previous: Path | None = None, known: dict | None = None) -> dict:
+        tmp = dest.with_suffix(".partial")
+        stats = write_zip(list(walk_files(workspace)), tmp, level=self.level, workers=self.workers)
+        os.replace(tmp, dest)
+        return stats
+
+    def restore(self, path: Path, workspace: Path, known: dict | None = None) -> dict:
+        with zipfile.ZipFile(path, "r") as zf:
+            return restore_minimal(_ZipReader(zf), workspace)
+
+# ioctl(dst, FICLONE, src): share extents copy-on-write (btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+_NO_REFLINK = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS)
+
+class TreeBackend:
+    """Snapshot as a directory of reflinks (or hardlinks) to the workspace files.
+
+    Near-instant and nearly free in space. Hardlinked snapshots rely on tools
+    writing via replace-not-modify (utils.atomic_write_*), so a linked inode is
+    never changed in place; tools that run external processes get private copies
+    first (unshare_files).
+    """
+    suffix = ".tree"
+
+    def __init__(self):
+        self.reflink = fcntl is not None
+
+    def _clone(self, src: Path, dst: Path):
+        if self.reflink:
+            try:
+                with open(src, "rb") as fs, open(dst, "wb") as fd:
+                    fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+                shutil.copystat(src, dst)
+                return
+            except OSError as e:
+                dst.unlink(missing_ok=True)
+                if e.errno not in _NO_REFLINK:
+                    raise
+                self.reflink = False
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    def _link_tree(self, src: Path, dst: Path) -> dict:
+        dst.mkdir(parents=True, exist_ok=True)
+        stats = {"files": 0, "bytes_in": 0, "bytes_out": 0}
+        for rel, p, st in walk_files(src):
+            target = dst / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            self._clone(p, target)
+            stats["files"] += 1
+            stats["bytes_in"] += st.st_size
+        return stats
+
+    def capture(self, workspace: Path, dest: Path, previous: Path | None = None, known: dict | None = None) -> dict:
+        tmp = dest.with_suffix(".partial")
+        shutil.rmtree(tmp, ignore_errors=True)
+        stats = self._link_tree(workspace, tmp)
+        os.replace(tmp, dest)
+        return stats
+
+    def restore(self, path: Path, workspace: Path, known: dict | None = None) -> dict:
+        return restore_minimal(_TreeReader(path, self._clone), workspace)
+
+def make_backends(store: BlobStore, settings) -> dict:
+    return {
+        "manifest": ManifestBackend(store),
+        "zip": ZipBackend(level=settings.archive_level, workers=settings.archive_workers),
+        "tree": TreeBackend(),
+    }
+
+def backend_for(path: Path, backends: dict):
+    # checkpoints remember their format through the suffix, so backends can be switched at any time
+    for b in backends.values():
+        if path.suffix == b.suffix:
+            return b
+    raise ValueError(f"Unknown checkpoint format: {path.name}")
@@ -0,0 +1,17 @@
+from lilith.db import ProjectSummary, session_scope
+
+# Read side of project_summary; the counters are written by triggers only (migration 0004).
+
+FIELDS = [c.name for c in ProjectSummary.__table__.columns if c.name != "project_id"]
+
+def _as_dict(row) -> dict:
+    return {f: getattr(row, f) if row is not None else 0 for f in FIELDS}
+
+def get(project_id: int) -> dict:
+    with session_scope() as s:
+        return _as_dict(s.get(ProjectSummary, project_id))
+
+def many(project_ids: list) -> dict:
+    with session_scope() as s:
+        rows = {r.project_id: r for r in s.query(ProjectSummary).filter(ProjectSummary.project_id.in_(project_ids))}
+    return {pid: _as_dict(rows.get(pid)) for pid in project_ids}
@@ -1,21 +1,14 @@
 from pathlib import Path
-import os, hashlib, difflib, json
+import os, hashlib, tempfile
+from lilith.diffing import diff_text
 
 def safe_join(root: Path, relpath: str) -> Path:
-    # prevent path traversal
+    # prevent path traversal; a component-wise check, so workspace/1 does not admit workspace/10
     p = (root / relpath).resolve()
-    if not str(p).startswith(str(root.resolve())):
+    if not p.is_relative_to(root.resolve()):
         raise ValueError("Path traversal blocked")
     return p
 
-def ensure_safe_args(args: dict):
-    # MVP safety: block obvious dangerous inputs
-    bad = ["..", "~", "/etc/", "C:\\Windows"]
-    blob = json.dumps(args)
-    for b in bad:
-        if b in blob:
-            raise ValueError("Unsafe argument detected")
-
 def file_hash(p: Path) -> str:
     h = hashlib.sha256()
     with open(p, "rb") as f:
@@ -23,7 +16,50 @@ def file_hash(p: Path) -> str:
             h.update(chunk)
     return h.hexdigest()
 
+def prune_empty_dirs(d: Path, workspace: Path):
+    # remove `d` and its parents while empty, stopping at the workspace root
+    root = workspace.resolve()
+    d = d.resolve()
+    while d != root and root in d.parents and d.exists() and not any(d.iterdir()):
+        d.rmdir()
+        d = d.parent
+
+def _atomic_write(p: Path, mode: str, data, encoding: str | None = None):
+    # Write a sibling temp file and rename it over the target (replace-not-modify):
+    # readers never see a half-written file and hardlinked snapshots keep the old inode.
+    fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=f".{p.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            f.write(data)
+        os.chmod(tmp, p.stat().st_mode & 0o7777 if p.exists() else 0o644)
+        os.replace(tmp, p)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def atomic_write_text(p: Path, text: str, encoding: str = "utf-8"):
+    _atomic_write(p, "w", text, encoding=encoding)
+
+def atomic_write_bytes(p: Path, data: bytes):
+    _atomic_write(p, "wb", data)
+
+def atomic_rewrite_text(p: Path, fill, before_replace=None, encoding: str = "utf-8") -> bool:
+    """Stream `p` through `fill(src, dst) -> changed` into a sibling temp file and rename it
+    over `p` only if something changed (calling `before_replace()` first). Newlines are kept."""
+    fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=f".{p.name}.", suffix=".tmp")
+    try:
+        with open(p, encoding=encoding, newline="") as src, os.fdopen(fd, "w", encoding=encoding, newline="") as dst:
+            changed = fill(src, dst)
+        if changed:
+            if before_replace is not None:
+                before_replace()
+            os.chmod(tmp, p.stat().st_mode & 0o7777)
+            os.replace(tmp, p)
+        return changed
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
 def make_diff(before: str, after: str, rel: str) -> str:
-    before_lines = before.splitlines(keepends=True)
-    after_lines = after.splitlines(keepends=True)
-    return "".join(difflib.unified_diff(before_lines, after_lines, fromfile=f"a/{rel}", tofile=f"b/{rel}"))
+    return diff_text(before, after, rel)
@@ -0,0 +1,21 @@
+import pytest
+from lilith import db, executor
+from lilith.blobs import BlobStore
+from lilith.config import get_settings
+from lilith.db import Project, session_scope
+from lilith.snapshots import make_backends
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    db.init_db(tmp_path / "t.db")
+    blobs = BlobStore(tmp_path / "checkpoints" / "_blobs")
+    monkeypatch.setattr(executor, "CHECKPOINTS", tmp_path / "checkpoints")
+    monkeypatch.setattr(executor, "BLOBS", blobs)
+    monkeypatch.setattr(executor, "SNAPSHOT_BACKENDS", make_backends(blobs, get_settings()))
+    with session_scope() as s:
+        p = Project(title="t", goal="")
+        s.add(p)
+    ws = tmp_path / "workspace" / str(p.id)
+    ws.mkdir(parents=True)
+    (ws / "README.md").write_text("original\n", encoding="utf-8")
+    return p.id, ws
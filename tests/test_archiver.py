@@ -0,0 +1,38 @@
+import os, zipfile
+from lilith import archiver
+from lilith.archiver import write_zip
+from lilith.snapshots import walk_files
+
+def test_zip_roundtrip(tmp_path):
+    ws = tmp_path / "ws"
+    (ws / "sub").mkdir(parents=True)
+    (ws / "a.txt").write_text("hello\n" * 1000, encoding="utf-8")
+    (ws / "sub" / "b.png").write_bytes(os.urandom(5000))
+    (ws / "c.bin").write_bytes(os.urandom(3000))
+    dest = tmp_path / "cp.zip"
+    stats = write_zip(list(walk_files(ws)), dest, workers=2)
+    assert stats["stored"] == 2
+    with zipfile.ZipFile(dest) as zf:
+        assert zf.testzip() is None
+        for rel, p, _ in walk_files(ws):
+            assert zf.read(rel) == p.read_bytes()
+
+def test_stored_entry_changed_during_archiving(tmp_path, monkeypatch):
+    ws = tmp_path / "ws"
+    ws.mkdir()
+    img = ws / "a.png"
+    img.write_bytes(os.urandom(4000))
+    compress = archiver._compress
+
+    def compress_then_change(p, level):
+        # the file changes after the worker looked at it, before the writer copies it
+        result = compress(p, level)
+        p.write_bytes(os.urandom(6000))
+        return result
+
+    monkeypatch.setattr(archiver, "_compress", compress_then_change)
+    dest = tmp_path / "cp.zip"
+    write_zip(list(walk_files(ws)), dest)
+    with zipfile.ZipFile(dest) as zf:
+        assert zf.testzip() is None
+        assert zf.read("a.png") == img.read_bytes()
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+import pytest
+from lilith.registry import TOOL_REGISTRY, ArgsError
+from lilith.mirror import run_mirror, run_plan_mirror
+from lilith.multireplace import glob_root
+
+@pytest.mark.parametrize("replacements,error", [
+    (["x"], "expected an object with search and replace"),
+    ([{"search": 1, "replace": "y"}], "search must be a string"),
+    ([{"replace": "y"}], "search must be a string"),
+    ([{"search": "x", "replace": ["y"]}], "replace must be a string"),
+    ([{"search": "x", "regex": "yes"}], "regex must be true or false"),
+])
+def test_bad_items_are_args_errors(tmp_path, replacements, error):
+    args = {"glob": "**/*.txt", "replacements": [{"search": "a", "replace": "b"}, *replacements]}
+    with pytest.raises(ArgsError) as e:
+        TOOL_REGISTRY["bulk_replace"].validate(tmp_path, args)
+    assert e.value.errors == [{"field": "replacements[1]", "error": error}]
+
+def test_mirrors_report_bad_items(tmp_path):
+    (tmp_path / "a.txt").write_text("x\n", encoding="utf-8")
+    step = SimpleNamespace(id=1, project_id=1, title="t", tool="bulk_replace",
+                           args_json={"glob": "*.txt", "replacements": ["x"]})
+    with pytest.raises(ArgsError):
+        run_mirror(step, tmp_path)
+    out = run_plan_mirror([step], tmp_path)
+    assert out["steps"][0]["errors"] == [{"field": "replacements[0]", "error": "expected an object with search and replace"}]
+
+def test_valid_items_pass(tmp_path):
+    (tmp_path / "a.txt").write_text("x\n", encoding="utf-8")
+    step = SimpleNamespace(id=1, project_id=1, title="t", tool="bulk_replace",
+                           args_json={"glob": "*.txt", "replacements": [{"search": "x", "replace": "y", "regex": False}]})
+    assert "a.txt" in str(run_mirror(step, tmp_path))
+
+@pytest.mark.parametrize("glob,root", [("site/**/*.html", "site"), ("a/b.txt", "a/b.txt"), ("**/*", None), ("", None)])
+def test_glob_root(glob, root):
+    assert glob_root(glob) == root
+
+@pytest.mark.parametrize("args,touches", [({"glob": "site/*.html"}, ["site"]), ({"glob": "*.txt"}, None), ({}, None)])
+def test_touches_follows_the_default_glob(args, touches):
+    assert TOOL_REGISTRY["bulk_replace"].touches({"replacements": [], **args}) == touches
@@ -0,0 +1,65 @@
+from concurrent.futures import Future
+import sys, threading, time
+import pytest
+from lilith import executor, fileindex, snapshots
+from lilith.config import get_settings
+from lilith.db import Step, Checkpoint, Event, session_scope
+from lilith.utils import file_hash
+
+def _append_step(project_id: int) -> int:
+    with session_scope() as s:
+        st = Step(project_id=project_id, title="append", tool="run_command",
+                  args_json={"cmd": [sys.executable, "-c", "open('README.md', 'a').write('appended\\n')"]})
+        s.add(st)
+    return st.id
+
+@pytest.mark.parametrize("backend,async_cp", [("manifest", True), ("manifest", False), ("tree", False)])
+def test_in_place_command_keeps_checkpoint(project, monkeypatch, backend, async_cp):
+    monkeypatch.setattr(get_settings(), "snapshot_backend", backend)
+    monkeypatch.setattr(get_settings(), "async_checkpoints", async_cp)
+    pid, ws = project
+    # as the apply_step job does, with the finalizer held up so the step runs before it
+    executor._FINALIZER.submit(threading.Event().wait, 0.5)
+    cp = executor.begin_checkpoint(pid, ws)
+    executor.run_step(_append_step(pid), ws)
+    cp.result()
+    assert (ws / "README.md").read_text(encoding="utf-8") == "original\nappended\n"
+    with session_scope() as s:
+        cp_id = s.query(Checkpoint.id).filter(Checkpoint.project_id == pid).scalar()
+    executor.restore_checkpoint(cp_id, ws)
+    assert (ws / "README.md").read_text(encoding="utf-8") == "original\n"
+    # the restored file must not share an inode with the snapshot either
+    executor.run_step(_append_step(pid), ws)
+    executor.restore_checkpoint(cp_id, ws)
+    assert (ws / "README.md").read_text(encoding="utf-8") == "original\n"
+
+def test_failed_checkpoint_keeps_steps_applied(project):
+    pid, ws = project
+    sid = _append_step(pid)
+    executor.run_step(sid, ws)
+    fut = Future()
+    fut.set_exception(OSError("disk full"))
+    executor.settle_checkpoint(pid, [sid], fut)
+    executor.SINK.flush()
+    with session_scope() as s:
+        assert s.get(Step, sid).status == "applied"
+        ev = s.query(Event).filter(Event.project_id == pid, Event.kind == "checkpoint_failed").one()
+        assert ev.step_id == sid and ev.payload_json["error"] == "disk full"
+
+def test_manifest_restore_hashes_only_changed_files(project, monkeypatch):
+    monkeypatch.setattr(get_settings(), "snapshot_backend", "manifest")
+    pid, ws = project
+    for i in range(20):
+        (ws / f"f{i}.txt").write_text(f"file {i:02d}\n", encoding="utf-8")
+    time.sleep(0.01)  # index entries must be newer than the files to be trusted
+    fileindex.rescan(pid, ws)
+    executor.checkpoint_now(pid, ws)
+    (ws / "f3.txt").write_text("edit 03\n", encoding="utf-8")  # same size, different content
+    hashed = []
+    monkeypatch.setattr(snapshots, "file_hash", lambda p: hashed.append(p.name) or file_hash(p))
+    with session_scope() as s:
+        cp_id = s.query(Checkpoint.id).filter(Checkpoint.project_id == pid).scalar()
+    stats = executor.restore_checkpoint(cp_id, ws)
+    assert hashed == ["f3.txt"]
+    assert (stats["written"], stats["unchanged"]) == (1, 20)
+    assert (ws / "f3.txt").read_text(encoding="utf-8") == "file 03\n"
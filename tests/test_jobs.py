@@ -0,0 +1,40 @@
+import pytest
+from sqlalchemy import event
+from lilith import db, jobs
+from lilith.db import Job, session_scope
+
+@pytest.fixture
+def queue(tmp_path):
+    db.init_db(tmp_path / "t.db")
+    return db.SessionLocal.kw["bind"]
+
+def test_one_running_job_per_project(queue):
+    a = jobs.enqueue("k", {}, project_id=1)
+    b = jobs.enqueue("k", {}, project_id=1)
+    c = jobs.enqueue("k", {}, project_id=2)
+    assert jobs._claim().id == a
+    assert jobs._claim().id == c  # b waits for a
+    assert jobs._claim() is None
+    jobs._finish(a, status="done")
+    job = jobs._claim()
+    assert (job.id, job.status, job.attempts) == (b, "running", 1)
+
+def test_claim_lost_to_another_process(queue):
+    a = jobs.enqueue("k", {}, project_id=1)
+    b = jobs.enqueue("k", {}, project_id=2)
+    raced = []
+
+    def other_worker(conn, cursor, statement, parameters, context, executemany):
+        # another process claims job a between our pick and our UPDATE
+        if statement.startswith("UPDATE jobs") and not raced:
+            raced.append(a)
+            cursor.execute("UPDATE jobs SET status = 'running', attempts = 1 WHERE id = ?", (a,))
+
+    event.listen(queue, "before_cursor_execute", other_worker)
+    try:
+        job = jobs._claim()
+    finally:
+        event.remove(queue, "before_cursor_execute", other_worker)
+    assert raced and job.id == b
+    with session_scope() as s:
+        assert s.get(Job, a).attempts == 1  # claimed once, by the other worker
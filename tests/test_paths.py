@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+import pytest
+from lilith.utils import safe_join
+from lilith.registry import TOOL_REGISTRY, ArgsError
+from lilith.mirror import run_mirror
+
+@pytest.fixture
+def workspaces(tmp_path):
+    # project ids 1 and 10 share a string prefix
+    for pid in ("1", "10"):
+        (tmp_path / pid).mkdir()
+    (tmp_path / "10" / "secret.txt").write_text("keep", encoding="utf-8")
+    return tmp_path / "1", tmp_path / "10"
+
+def test_safe_join_rejects_sibling_with_shared_prefix(workspaces):
+    ws, _ = workspaces
+    assert safe_join(ws, "a/b.txt") == (ws / "a" / "b.txt").resolve()
+    for rel in ("../10/secret.txt", "../10", "../../x"):
+        with pytest.raises(ValueError):
+            safe_join(ws, rel)
+
+@pytest.mark.parametrize("tool,args,field", [
+    ("write_file", {"path": "../10/secret.txt", "content": "x"}, "path"),
+    ("run_command", {"cmd": "echo hi", "cwd": "../10"}, "cwd"),
+])
+def test_validate_reports_escape(workspaces, tool, args, field):
+    ws, other = workspaces
+    with pytest.raises(ArgsError) as e:
+        TOOL_REGISTRY[tool].validate(ws, args)
+    assert e.value.errors == [{"field": field, "error": "path escapes the workspace"}]
+    assert (other / "secret.txt").read_text(encoding="utf-8") == "keep"
+
+def test_mirror_rejects_escape(workspaces):
+    ws, _ = workspaces
+    step = SimpleNamespace(project_id=1, tool="write_file", args_json={"path": "../10/secret.txt", "content": "x"})
+    with pytest.raises(ArgsError):
+        run_mirror(step, ws)
+
+@pytest.mark.parametrize("tool", ["write_file", "replace_text"])
+def test_path_is_required(tmp_path, tool):
+    with pytest.raises(ArgsError) as e:
+        TOOL_REGISTRY[tool].validate(tmp_path, {"content": "x", "search": "a"})
+    assert e.value.errors == [{"field": "path", "error": "required"}]
+    step = SimpleNamespace(project_id=1, tool=tool, args_json={"path": None, "content": "x"})
+    with pytest.raises(ArgsError):
+        run_mirror(step, tmp_path)
@@ -0,0 +1,14 @@
+import sys
+import pytest
+from lilith import procs
+
+@pytest.mark.skipif(procs.resource is None, reason="rlimits are POSIX-only")
+def test_limits_apply_from_the_first_instruction(tmp_path):
+    probe = "import resource; print(resource.getrlimit(resource.RLIMIT_CPU)[0], resource.getrlimit(resource.RLIMIT_AS)[0])"
+    res = procs.run([sys.executable, "-c", probe], tmp_path, cpu_s=7, mem_mb=4096)
+    assert res["status"] == "exited", res["output"]
+    assert res["output"].split() == ["7", str(4096 * 1024 * 1024)]
+
+def test_output_and_exit_code(tmp_path):
+    res = procs.run([sys.executable, "-c", "print('hi'); raise SystemExit(3)"], tmp_path)
+    assert (res["status"], res["code"], res["output"].strip()) == ("exited", 3, "hi")
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+import json, os, time
+from lilith import jobs
+from lilith.blobs import BlobStore
+from lilith.db import Checkpoint, session_scope
+from lilith.retention import RetentionPolicy, collect_garbage, pinned, plan_retention, prune_project
+
+def _checkpoints(project_id: int, root: Path, ages_h: list, size: int = 10) -> list[int]:
+    """One zip-like file per age (hours before now), oldest first; returns ids newest first."""
+    now = datetime.utcnow()
+    root.mkdir(parents=True, exist_ok=True)
+    with session_scope() as s:
+        cps = []
+        for i, h in enumerate(sorted(ages_h, reverse=True)):
+            p = root / f"{i}.zip"
+            p.write_bytes(b"x" * size)
+            cps.append(Checkpoint(project_id=project_id, zip_path=str(p), ts=now - timedelta(hours=h)))
+        s.add_all(cps)
+    return [c.id for c in reversed(cps)]
+
+def test_queued_restore_keeps_its_checkpoint(project, tmp_path):
+    pid, _ = project
+    ids = _checkpoints(pid, tmp_path / "cps", [1, 2, 3, 4])
+    jobs.enqueue("restore", {"checkpoint_id": ids[-1]}, project_id=pid)
+    summary = prune_project(pid, RetentionPolicy(keep_last=1, keep_hourly=0, keep_daily=0))
+    assert summary["deleted"] == ids[1:3]
+    with session_scope() as s:
+        assert {c.id for c in s.query(Checkpoint)} == {ids[0], ids[-1]}
+
+def _cp(i: int, ts: datetime, path: Path | None = None):
+    return SimpleNamespace(id=i, ts=ts, zip_path=str(path or f"/nonexistent/{i}.zip"))
+
+def test_keep_last_hourly_daily_thinning():
+    base = datetime(2026, 1, 10, 12, 0)
+    cps = [_cp(i, base - timedelta(minutes=30 * i)) for i in range(144)]  # three days, newest first
+    doomed = plan_retention(cps, RetentionPolicy(keep_last=3, keep_hourly=5, keep_daily=2), set())
+    # last 3; newest of hours 12, 11, 10, 9, 8; newest of Jan 10 and Jan 9 (23:30 is i=25)
+    kept = {0, 1, 2} | {0, 1, 3, 5, 7} | {0, 25}
+    assert {c.id for c in doomed} == set(range(144)) - kept
+
+def _manifest(path: Path, files: dict) -> Path:
+    path.write_text(json.dumps({"version": 1, "created_ns": 0, "files": {
+        rel: {"sha256": sha, "size": size, "mtime_ns": 0} for rel, (sha, size) in files.items()}}), encoding="utf-8")
+    return path
+
+def test_budget_counts_shared_blobs_once(tmp_path):
+    now = datetime.utcnow()
+    newest = _manifest(tmp_path / "3.json", {"a": ("A", 1000)})
+    middle = _manifest(tmp_path / "2.json", {"a": ("A", 1000), "b": ("B", 1000)})
+    oldest = _manifest(tmp_path / "1.json", {"c": ("C", 5000)})
+    cps = [_cp(3, now, newest), _cp(2, now, middle), _cp(1, now, oldest)]
+    # room for A and B once each: charging A to both manifests would also drop the middle one
+    budget = newest.stat().st_size + middle.stat().st_size + 2000 + 500
+    policy = RetentionPolicy(keep_last=3, keep_hourly=0, keep_daily=0, max_bytes=budget)
+    assert [c.id for c in plan_retention(cps, policy, set())] == [1]
+    # protected checkpoints stay even when they do not fit
+    assert plan_retention(cps, policy, {1}) == []
+
+def test_newest_and_pinned_checkpoints_survive(project, tmp_path):
+    pid, _ = project
+    ids = _checkpoints(pid, tmp_path / "cps", [1, 2, 3, 4])
+    with session_scope() as s:
+        pinned_path = s.get(Checkpoint, ids[2]).zip_path
+    with pinned(pinned_path):
+        summary = prune_project(pid, RetentionPolicy(keep_last=0, keep_hourly=0, keep_daily=0))
+    assert summary["deleted"] == [ids[1], ids[3]]
+    assert summary["bytes"] == 20
+    with session_scope() as s:
+        left = {c.id: c.zip_path for c in s.query(Checkpoint)}
+    assert set(left) == {ids[0], ids[2]}
+    assert all(Path(p).exists() for p in left.values())
+    assert sorted(p.name for p in (tmp_path / "cps").iterdir()) == sorted(Path(p).name for p in left.values())
+
+def test_garbage_collection(project, tmp_path):
+    pid, _ = project
+    root = tmp_path / "checkpoints"
+    store = BlobStore(root / "_blobs")
+    live, dead, young = store.put_bytes(b"live"), store.put_bytes(b"dead"), store.put_bytes(b"young")
+    (root / "1").mkdir()
+    _manifest(root / "1" / "10.json", {"a": (live, 4)})
+    orphan = root / "1" / "11.zip"
+    orphan.write_bytes(b"zz")
+    held = root / "1" / "12.zip"
+    held.write_bytes(b"zz")
+    old = time.time() - 7200
+    for p in (store.path_for(live), store.path_for(dead), orphan, held):
+        os.utime(p, (old, old))
+    with session_scope() as s:
+        s.add(Checkpoint(project_id=pid, zip_path=str(root / "1" / "10.json")))
+    with pinned(held):
+        stats = collect_garbage(root, store, grace_s=3600)
+    assert (stats["blobs"], stats["orphans"]) == (1, 1)
+    assert store.has(live) and store.has(young) and not store.has(dead)
+    assert not orphan.exists() and held.exists()
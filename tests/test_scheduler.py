@@ -0,0 +1,53 @@
+from lilith import executor
+from lilith.config import get_settings
+from lilith.db import Step, Event, session_scope
+from lilith.eventsink import SINK
+from lilith.scheduler import build_graph, run_plan
+
+def _steps(project_id: int, *specs) -> list[int]:
+    with session_scope() as s:
+        steps = [Step(project_id=project_id, title=f"s{i}", order_idx=i, tool=tool, args_json=args,
+                      depends_on=deps) for i, (tool, args, deps) in enumerate(specs)]
+        s.add_all(steps)
+    return [st.id for st in steps]
+
+def test_failed_branch_skips_only_its_dependents(project, monkeypatch):
+    monkeypatch.setattr(get_settings(), "async_checkpoints", False)
+    pid, ws = project
+    (ws / "site").mkdir()
+    broken, below, other, after = _steps(
+        pid,
+        ("write_file", {"path": "site", "content": "x"}, []),  # IsADirectoryError, not a ToolError
+        ("write_file", {"path": "site/index.html", "content": "<h1>"}, []),  # overlaps: waits for it
+        ("write_file", {"path": "notes.txt", "content": "n"}, []),
+        ("write_file", {"path": "more.txt", "content": "m"}, None),
+    )
+    with session_scope() as s:
+        s.get(Step, after).depends_on = [other]
+    summary = run_plan(pid, ws, workers=2)
+    assert (summary["failed"], summary["skipped"], sorted(summary["applied"])) == ([broken], [below], [other, after])
+    executor.wait_checkpoints(pid)
+    SINK.flush()
+    with session_scope() as s:
+        status = {st.id: st.status for st in s.query(Step).filter(Step.project_id == pid)}
+        kinds = [(e.kind, e.step_id) for e in s.query(Event).filter(Event.project_id == pid)]
+        err = s.query(Event).filter(Event.kind == "error", Event.step_id == broken).one()
+    assert status == {broken: "error", below: "skipped", other: "done", after: "done"}
+    assert ("plan_applied", None) in kinds and ("checkpoint", None) in kinds
+    assert err.payload_json["error"].startswith("IsADirectoryError")
+
+def test_graph_orders_overlapping_paths(project):
+    pid, _ = project
+    ids = _steps(pid, ("write_file", {"path": "a/b.txt"}, []), ("write_file", {"path": "a"}, []),
+                 ("write_file", {"path": "c.txt"}, []))
+    with session_scope() as s:
+        steps = s.query(Step).filter(Step.id.in_(ids)).all()
+    assert build_graph(steps) == {ids[0]: set(), ids[1]: {ids[0]}, ids[2]: set()}
+
+def test_bulk_replace_without_glob_serializes(project):
+    pid, _ = project
+    ids = _steps(pid, ("bulk_replace", {"replacements": [{"search": "a", "replace": "b"}]}, []),
+                 ("write_file", {"path": "site/index.html"}, []))
+    with session_scope() as s:
+        steps = s.query(Step).filter(Step.id.in_(ids)).all()
+    assert build_graph(steps) == {ids[0]: set(), ids[1]: {ids[0]}}